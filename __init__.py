@@ -20,7 +20,11 @@ from .src.ak_video_speed_adjust import AK_VideoSpeedAdjust
 from .src.ak_convert_list_to_float_list import AK_ConvertListToFloatList
 from .src.ak_shrink_num_sequence import AK_ShrinkNumSequence
 from .src.ak_dilate_mask_linear_infinite import AK_DilateMaskLinearInfinite
+from .src.ak_dilate_mask_instances_infinite import AK_DilateMaskInstancesInfinite
+from .src.ak_mask_distance_field import AK_MaskDistanceField
 from .src.ak_audio_framesync_schedule import AK_AudioFramesyncSchedule
+from .src.ak_audio_framesync_bands import AK_AudioFramesyncBands
+from .src.ak_audio_onset_triggers import AK_AudioOnsetTriggers
 from .src.ak_audioreactive_dilate_mask_infinite import AK_AudioreactiveDilateMaskInfinite
 from .src.ak_keyframe_scheduler import AK_KeyframeScheduler
 from .src.ak_scheduled_binary_comparison import AK_ScheduledBinaryComparison
@@ -52,7 +56,11 @@ NODE_CONFIG = {
   "AK_ConvertListToFloatList": {"class": AK_ConvertListToFloatList, "name": "Convert List To Float List"},
   "AK_ShrinkNumSequence": {"class": AK_ShrinkNumSequence, "name": "Shrink Num Sequence"},
   "AK_DilateMaskLinearInfinite": {"class": AK_DilateMaskLinearInfinite, "name": "Dilate Mask Linear Infinite"},
+  "AK_DilateMaskInstancesInfinite": {"class": AK_DilateMaskInstancesInfinite, "name": "Dilate Mask Instances Infinite"},
+  "AK_MaskDistanceField": {"class": AK_MaskDistanceField, "name": "Mask Distance Field"},
   "AK_AudioFramesyncSchedule": {"class": AK_AudioFramesyncSchedule, "name": "Schedule Audio Framesync"},
+  "AK_AudioFramesyncBands": {"class": AK_AudioFramesyncBands, "name": "Schedule Audio Framesync Bands"},
+  "AK_AudioOnsetTriggers": {"class": AK_AudioOnsetTriggers, "name": "Audio Onset Triggers"},
   "AK_AudioreactiveDilateMaskInfinite": {"class": AK_AudioreactiveDilateMaskInfinite, "name": "Audioreactive Dilate Mask Infinite"},
   "AK_KeyframeScheduler": {"class": AK_KeyframeScheduler, "name": "Keyframe Scheduler"},
   "AK_ScheduledBinaryComparison": {"class": AK_ScheduledBinaryComparison, "name": "Scheduled Binary Comparison"},
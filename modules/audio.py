@@ -0,0 +1,455 @@
+import io
+import os
+import struct
+import wave
+import numpy as np
+import torch
+
+# Vectorized loudness analysis for the audio nodes.
+#
+# The PCM of a track is held in one [samples, channels] NumPy array. Frame k
+# covers samples [k * sample_rate // frame_rate, (k + 1) * sample_rate //
+# frame_rate), so frame boundaries are exact to the sample and never drift,
+# whether or not the frame rate divides the sample rate. Every per-frame
+# statistic is then a single reduction over those windows.
+#
+# AUDIO inputs are read without going through pydub where possible: a ComfyUI
+# AUDIO dict is used in place as a NumPy view of its waveform, PCM WAV bytes are
+# decoded with the wave module, and pydub is only imported for other containers.
+# Long WAV files can be streamed instead: WavFile memory-maps the file and the
+# analysis reads it a block of whole seconds at a time.
+
+# Samples squared at a time by window_rms
+RMS_BLOCK_SAMPLES = 1 << 14
+
+# NumPy dtype of signed PCM samples by sample width in bytes
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# Seconds of audio analysed per block by loudness_stats
+STREAM_BLOCK_SECONDS = 10
+
+# Frames transformed per 2D FFT by frame_spectra
+BAND_BLOCK_FRAMES = 512
+
+# Log compression of spectral magnitudes in spectral_flux
+FLUX_COMPRESSION = 1000.0
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def pcm_samples(raw_data, sample_width, channels):
+    """[samples, channels] view of interleaved signed PCM bytes, without copying them."""
+    if sample_width not in SAMPLE_DTYPES:
+        raise ValueError(f"Unsupported sample width {sample_width}, expected one of {list(SAMPLE_DTYPES)}.")
+    samples = np.frombuffer(raw_data, dtype=SAMPLE_DTYPES[sample_width])
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+def wav_pcm(raw, sample_width, channels):
+    """
+    [samples, channels] signed PCM of WAV sample data (bytes or a uint8 array).
+
+    8-bit WAV is unsigned and is shifted to signed samples; 24-bit samples are
+    widened to int32 with the low byte empty, the same samples pydub reads.
+    """
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8) ^ 0x80).view(np.int8)
+    elif sample_width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8)
+        packed = packed[:len(packed) - len(packed) % 3].reshape(-1, 3)
+        widened = np.zeros((len(packed), 4), dtype=np.uint8)
+        widened[:, 1:] = packed
+        samples = widened.view("<i4").reshape(-1)
+    else:
+        return pcm_samples(raw, sample_width, channels)
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+def wav_samples(data):
+    """([samples, channels] signed PCM, sample_rate) of WAV file bytes, or None when wave cannot read them."""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, sample_width, sample_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    return wav_pcm(raw, sample_width, channels), sample_rate
+
+class WavFile:
+    """
+    A PCM or float WAV file on disk, memory-mapped and read block by block.
+
+    Only the RIFF header is parsed up front. read() maps just the requested
+    samples and unmaps them again once converted, so neither the process
+    memory nor its resident mapped pages grow with the track length.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            header = file.read(12)
+            if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                raise ValueError(f"'{path}' is not a WAV file.")
+            fmt = None
+            while True:
+                chunk = file.read(8)
+                if len(chunk) < 8:
+                    raise ValueError(f"No audio data found in '{path}'.")
+                chunk_id, size = chunk[:4], int.from_bytes(chunk[4:], "little")
+                if chunk_id == b"data":
+                    data_offset = file.tell()
+                    break
+                if chunk_id == b"fmt ":
+                    fmt = file.read(size)
+                    file.seek(size & 1, os.SEEK_CUR)
+                else:
+                    file.seek(size + (size & 1), os.SEEK_CUR)
+            file_size = os.fstat(file.fileno()).st_size
+        if fmt is None or len(fmt) < 16:
+            raise ValueError(f"'{path}' has no valid fmt chunk.")
+        format_tag, self.channels, self.sample_rate = struct.unpack_from("<HHI", fmt)
+        bits = struct.unpack_from("<H", fmt, 14)[0]
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            format_tag = struct.unpack_from("<H", fmt, 24)[0]
+        self.sample_width = bits // 8
+        self.is_float = format_tag == WAVE_FORMAT_IEEE_FLOAT
+        if not (format_tag == WAVE_FORMAT_PCM and self.sample_width in (1, 2, 3, 4)
+                or self.is_float and self.sample_width in (4, 8)):
+            raise ValueError(f"Unsupported WAV encoding in '{path}' (format {format_tag}, {bits} bits).")
+        # Streaming writers may leave the data size at 0 or past the end of the file
+        data_size = file_size - data_offset if size == 0 else min(size, file_size - data_offset)
+        self._data_offset = data_offset
+        self._frame_bytes = self.channels * self.sample_width
+        self.num_samples = data_size // self._frame_bytes
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def full_scale(self):
+        if self.is_float:
+            return 1.0
+        return full_scale(SAMPLE_DTYPES[4 if self.sample_width == 3 else self.sample_width])
+
+    def read(self, low, high):
+        """[samples, channels] samples low..high - 1, as float for float WAV and signed PCM otherwise."""
+        low, high = max(low, 0), min(high, self.num_samples)
+        if high <= low:
+            raw = np.zeros(0, dtype=np.uint8)
+        else:
+            mapped = np.memmap(self.path, dtype=np.uint8, mode="r", offset=self._data_offset + low * self._frame_bytes,
+                               shape=((high - low) * self._frame_bytes,))
+            raw = np.array(mapped)
+            del mapped
+        if self.is_float:
+            return raw.view("<f4" if self.sample_width == 4 else "<f8").reshape(-1, self.channels)
+        return wav_pcm(raw, self.sample_width, self.channels)
+
+def decode_audio_bytes(data):
+    """([samples, channels], sample_rate) of audio file bytes: WAV natively, other containers through pydub."""
+    decoded = wav_samples(data)
+    if decoded is not None:
+        return decoded
+    from pydub import AudioSegment
+    segment = AudioSegment.from_file(io.BytesIO(data))
+    return pcm_samples(segment.raw_data, segment.sample_width, segment.channels), segment.frame_rate
+
+def audio_samples(audio):
+    """
+    ([samples, channels], sample_rate) of an AUDIO input.
+
+    A ComfyUI AUDIO dict ({"waveform": [batch, channels, samples], "sample_rate"})
+    gives a transposed view of its first batch item, without copying a CPU
+    waveform; anything else is taken as audio file bytes.
+    """
+    if isinstance(audio, dict):
+        waveform = audio["waveform"]
+        if isinstance(waveform, torch.Tensor):
+            waveform = waveform.detach().cpu().numpy()
+        waveform = np.asarray(waveform)
+        if waveform.ndim == 3:
+            waveform = waveform[0]
+        return waveform.reshape(-1, waveform.shape[-1]).T, int(audio["sample_rate"])
+    return decode_audio_bytes(audio)
+
+def open_audio(audio=None, audio_path=""):
+    """
+    (read, num_samples, sample_rate, full_scale) of a node's audio source.
+
+    A non-empty audio_path is streamed from disk through WavFile, otherwise
+    the AUDIO input is loaded with audio_samples. read(low, high) returns
+    samples low..high - 1 as a [samples, channels] array.
+    """
+    if audio_path.strip():
+        wav_file = WavFile(audio_path.strip())
+        return wav_file.read, len(wav_file), wav_file.sample_rate, wav_file.full_scale
+    if audio is None:
+        raise ValueError("Connect an audio input or set audio_path.")
+    samples, sample_rate = audio_samples(audio)
+    return (lambda low, high: samples[low:high]), len(samples), sample_rate, full_scale(samples.dtype)
+
+def full_scale(dtype):
+    """Amplitude of a full-scale sample: 2^(bits - 1) for signed integer PCM, 1.0 for float samples."""
+    if np.issubdtype(dtype, np.integer):
+        return float(np.iinfo(dtype).max) + 1.0
+    return 1.0
+
+def frame_boundary(frame, sample_rate, frame_rate):
+    """First sample of a frame."""
+    return frame * sample_rate // frame_rate
+
+def frame_boundaries(start_frame, end_frame, sample_rate, frame_rate):
+    """Sample boundaries of frames start_frame..end_frame - 1, end_frame - start_frame + 1 values."""
+    frames = np.arange(start_frame, max(end_frame, start_frame) + 1, dtype=np.int64)
+    return frame_boundary(frames, sample_rate, frame_rate)
+
+def frame_count(num_samples, sample_rate, frame_rate):
+    """Number of whole frames in num_samples samples."""
+    return num_samples * frame_rate // sample_rate
+
+def frame_range(num_samples, sample_rate, frame_rate, start_frame=0, end_frame=0):
+    """
+    (frames, end_sample) of the analysed part of a track.
+
+    frames counts the whole frames from start_frame up to end_frame (the end
+    of the track when end_frame <= 0); end_sample is where normalization stops.
+    """
+    total_frames = frame_count(num_samples, sample_rate, frame_rate)
+    last_frame = total_frames if end_frame <= 0 else min(end_frame, total_frames)
+    end_sample = num_samples if end_frame <= 0 else min(frame_boundary(end_frame, sample_rate, frame_rate), num_samples)
+    return max(last_frame - start_frame, 0), end_sample
+
+def window_rms(samples, boundaries):
+    """
+    RMS over all channels of samples[boundaries[i]:boundaries[i + 1]] for every window.
+
+    For integer PCM the result is truncated to whole sample steps as with
+    pydub's audioop.rms, so a window quieter than one step reads as silence.
+    Empty windows are 0.
+    Squares are taken in blocks of about RMS_BLOCK_SAMPLES samples, so they
+    stay in cache and never need a float copy of the whole track.
+    """
+    samples = np.asarray(samples).reshape(len(samples), -1)
+    boundaries = np.asarray(boundaries, dtype=np.int64)
+    if len(boundaries) < 2:
+        return np.zeros(0)
+    lengths = np.diff(boundaries)
+    sums = np.zeros(len(lengths))
+    blocks = (boundaries[:-1] - boundaries[0]) // RMS_BLOCK_SAMPLES
+    block_starts = np.flatnonzero(np.diff(blocks, prepend=-1))
+    for first, last in zip(block_starts, np.append(block_starts[1:], len(lengths))):
+        low, high = boundaries[first], boundaries[last]
+        if high <= low:
+            continue
+        squares = np.square(samples[low:high], dtype=np.float64).reshape(-1)
+        offsets = np.minimum((boundaries[first:last] - low) * samples.shape[1], len(squares) - 1)
+        sums[first:last] = np.add.reduceat(squares, offsets)
+    sums[lengths == 0] = 0.0
+    rms = np.sqrt(sums / np.maximum(lengths * samples.shape[1], 1))
+    return np.floor(rms) if np.issubdtype(samples.dtype, np.integer) else rms
+
+def rms_to_dbfs(rms, full_scale_amplitude):
+    """dBFS of RMS values relative to a full-scale sample amplitude, -inf for silence."""
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(np.asarray(rms, dtype=np.float64) / full_scale_amplitude)
+
+def dbfs_range(chunk_dbfs, dbfs_min=0.0, dbfs_max=-float('inf')):
+    """Running (min, max) dBFS: min over the non-silent chunks, capped at 0, and max over all chunks."""
+    audible = chunk_dbfs[np.isfinite(chunk_dbfs)]
+    if len(audible):
+        dbfs_min = min(dbfs_min, float(audible.min()))
+    if len(chunk_dbfs):
+        dbfs_max = max(dbfs_max, float(chunk_dbfs.max()))
+    return dbfs_min, dbfs_max
+
+def loudness_stats(read, start_frame, last_frame, end_sample, sample_rate, frame_rate, full_scale_amplitude, block_seconds=STREAM_BLOCK_SECONDS):
+    """
+    dBFS of frames start_frame..last_frame - 1 and the (min, max) dBFS over one-second chunks.
+
+    The chunks run from the first sample of start_frame to end_sample. Samples
+    are fetched with read(low, high) a block of block_seconds at a time, and
+    the min/max is carried from block to block. Blocks start on whole seconds
+    from the first frame, which are frame boundaries too, so every frame and
+    chunk falls in a single block and the result does not depend on the block
+    size.
+    """
+    start_sample = frame_boundary(start_frame, sample_rate, frame_rate)
+    dbfs = np.full(max(last_frame - start_frame, 0), -np.inf)
+    dbfs_min, dbfs_max = 0.0, -float('inf')
+    block_samples = block_seconds * sample_rate
+    for low in range(start_sample, end_sample, block_samples):
+        high = min(low + block_samples, end_sample)
+        block = read(low, high)
+        chunk_boundaries = np.append(np.arange(0, high - low, sample_rate), high - low)
+        dbfs_min, dbfs_max = dbfs_range(rms_to_dbfs(window_rms(block, chunk_boundaries), full_scale_amplitude), dbfs_min, dbfs_max)
+        first = start_frame + (low - start_sample) // sample_rate * frame_rate
+        last = min(first + block_seconds * frame_rate, last_frame)
+        if last > first:
+            boundaries = frame_boundaries(first, last, sample_rate, frame_rate) - low
+            dbfs[first - start_frame:last - start_frame] = rms_to_dbfs(window_rms(block, boundaries), full_scale_amplitude)
+    return dbfs, dbfs_min, dbfs_max
+
+def frame_window(sample_rate, frame_rate):
+    """(window, n_fft): Hann window over sample_rate // frame_rate samples and the power-of-two FFT size it is padded to."""
+    window_length = max(sample_rate // frame_rate, 1)
+    return np.hanning(window_length).astype(np.float32), 1 << (window_length - 1).bit_length()
+
+def frame_spectra(read, start_frame, last_frame, sample_rate, frame_rate, block_frames=BAND_BLOCK_FRAMES):
+    """
+    Yield (first, last, power) for blocks of frames start_frame..last_frame - 1.
+
+    power is the [channels, frames, bins] rfft power spectrum of frames
+    first..last - 1. Every frame takes the frame_window samples from its first
+    sample, and the frames of a block go through one 2D rfft with all channels
+    at once.
+    """
+    window, n_fft = frame_window(sample_rate, frame_rate)
+    offsets = np.arange(len(window))
+    channels = read(0, 0).shape[1]
+    for first in range(start_frame, last_frame, block_frames):
+        last = min(first + block_frames, last_frame)
+        starts = frame_boundaries(first, last - 1, sample_rate, frame_rate)
+        low, high = starts[0], starts[-1] + len(window)
+        block = np.zeros((channels, high - low), dtype=np.float32)
+        samples = read(low, high)
+        block[:, :len(samples)] = samples.T
+        # [channels, frames, n_fft] zero-padded windows of the block
+        segments = np.zeros((channels, len(starts), n_fft), dtype=np.float32)
+        np.multiply(block[:, (starts - low)[:, None] + offsets], window, out=segments[..., :len(window)])
+        power = np.abs(np.fft.rfft(segments, axis=-1))
+        yield first, last, np.square(power, out=power)
+
+def band_matrix(band_edges, n_fft, window, sample_rate):
+    """
+    [bins, bands] weights that turn an rfft power spectrum into the mean square of each band.
+
+    Band i covers band_edges[i] <= frequency < band_edges[i + 1]. By Parseval's
+    theorem the weights of all bins add up to the frame's windowed mean square,
+    counting the mirrored half of the spectrum twice.
+    """
+    freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    weights = np.full(len(freqs), 2.0)
+    weights[0] = 1.0
+    if n_fft % 2 == 0:
+        weights[-1] = 1.0
+    weights /= n_fft * np.sum(np.square(window, dtype=np.float64))
+    edges = np.asarray(band_edges, dtype=np.float64)
+    matrix = np.zeros((len(freqs), len(edges) - 1))
+    for band, (low, high) in enumerate(zip(edges[:-1], edges[1:])):
+        in_band = (freqs >= low) & (freqs < high)
+        matrix[in_band, band] = weights[in_band]
+    return matrix
+
+def band_dbfs(read, start_frame, last_frame, sample_rate, frame_rate, full_scale_amplitude, band_edges, block_frames=BAND_BLOCK_FRAMES):
+    """
+    dBFS of the energy in each frequency band for frames start_frame..last_frame - 1, shape [bands, frames].
+
+    Frames are Hann-windowed and transformed block by block by frame_spectra,
+    and the channels' band energies are averaged, so a band spanning the whole
+    spectrum reads like the frame's RMS dBFS. Bands quieter than one integer
+    sample step (or one 16-bit step for float audio) are silent (-inf).
+    """
+    window, n_fft = frame_window(sample_rate, frame_rate)
+    matrix = band_matrix(band_edges, n_fft, window, sample_rate).astype(np.float32)
+    step = 1.0 if full_scale_amplitude > 1.0 else 1.0 / 32768
+    dbfs = np.full((matrix.shape[1], max(last_frame - start_frame, 0)), -np.inf)
+    for first, last, power in frame_spectra(read, start_frame, last_frame, sample_rate, frame_rate, block_frames):
+        mean_square = (power @ matrix).mean(axis=0, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            block_dbfs = np.where(mean_square >= step * step, 10 * np.log10(mean_square / full_scale_amplitude ** 2), -np.inf)
+        dbfs[:, first - start_frame:last - start_frame] = block_dbfs.T
+    return dbfs
+
+def spectral_flux(read, start_frame, last_frame, sample_rate, frame_rate, full_scale_amplitude, block_frames=BAND_BLOCK_FRAMES):
+    """
+    Onset strength of frames start_frame..last_frame - 1: the summed rise of every bin's log magnitude over the previous frame.
+
+    Magnitudes are averaged over channels, taken relative to a full-scale sine
+    and compressed with log1p(FLUX_COMPRESSION * magnitude). The first frame
+    has nothing to rise from and gets 0.
+    """
+    window, _ = frame_window(sample_rate, frame_rate)
+    scale = FLUX_COMPRESSION * 2 / (full_scale_amplitude * float(window.sum(dtype=np.float64)))
+    flux = np.zeros(max(last_frame - start_frame, 0))
+    previous = None
+    for first, last, power in frame_spectra(read, start_frame, last_frame, sample_rate, frame_rate, block_frames):
+        magnitude = np.log1p(np.sqrt(power.mean(axis=0)) * np.float32(scale))
+        if previous is None:
+            previous = magnitude[:1]
+        rise = np.diff(np.concatenate([previous, magnitude]), axis=0)
+        flux[first - start_frame:last - start_frame] = np.maximum(rise, 0).sum(axis=1, dtype=np.float64)
+        previous = magnitude[-1:]
+    return flux
+
+def moving_mean(values, radius):
+    """Mean of values[i - radius:i + radius + 1] for every i, over the frames that exist near the ends."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    index = np.arange(len(values))
+    low = np.maximum(index - radius, 0)
+    high = np.minimum(index + radius + 1, len(values))
+    return (cumulative[high] - cumulative[low]) / (high - low)
+
+def moving_max(values, radius):
+    """Max of values[i - radius:i + radius + 1] for every i."""
+    values = np.asarray(values)
+    if radius <= 0 or not len(values):
+        return values.copy()
+    padded = np.pad(values, radius, mode="edge")
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+
+def pick_onsets(strength, delta, mean_radius, min_spacing=1):
+    """
+    Frames at which strength peaks at least delta above its moving mean, at least min_spacing frames apart.
+
+    strength is scaled to a maximum of 1 first, so delta does not depend on the
+    track's level. Peaks closer than min_spacing keep the strongest one (the
+    earliest of equals); every pass keeps the peaks that are strongest in their
+    neighbourhood and drops the candidates they cover.
+    """
+    strength = np.asarray(strength, dtype=np.float64)
+    if not len(strength) or strength.max() <= 0:
+        return np.zeros(0, dtype=np.int64)
+    strength = strength / strength.max()
+    padded = np.concatenate(([-np.inf], strength, [-np.inf]))
+    candidates = (strength > padded[:-2]) & (strength >= padded[2:]) & (strength >= moving_mean(strength, mean_radius) + delta)
+
+    # Unique priorities: stronger first, then earlier
+    priority = np.empty(len(strength), dtype=np.int64)
+    priority[np.lexsort((np.arange(len(strength)), -strength))] = np.arange(len(strength), 0, -1)
+    radius = min_spacing - 1
+    onsets = np.zeros(len(strength), dtype=bool)
+    while radius > 0 and candidates.any():
+        values = np.where(candidates, priority, 0)
+        winners = candidates & (values == moving_max(values, radius))
+        onsets |= winners
+        candidates &= ~moving_max(winners, radius)
+    onsets |= candidates
+    return np.flatnonzero(onsets)
+
+def dbfs_to_loudness(dbfs, amp_control, amp_offset, dbfs_min, dbfs_max):
+    """Map dBFS values onto amp_offset..amp_offset + amp_control, silence maps to amp_offset."""
+    dbfs = np.asarray(dbfs, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        if dbfs_max - dbfs_min != 0:
+            normalized = (dbfs - dbfs_min) / (dbfs_max - dbfs_min)
+        else:
+            normalized = dbfs - dbfs_min
+        loudness = np.maximum(amp_offset, np.minimum(normalized * amp_control + amp_offset, amp_control + amp_offset))
+    return np.where(dbfs == -np.inf, amp_offset, loudness)
+
+def interpolate_easing(values, easing_function):
+    """
+    Ease every inner value towards its next neighbour, keeping the first and last.
+
+    Each value moves by half the step to the next value, scaled by the easing of
+    that step's share of the two neighbouring steps.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 3:
+        return values
+    diff_prev = values[1:-1] - values[:-2]
+    diff_next = values[2:] - values[1:-1]
+    direction = np.where(diff_next > diff_prev, 1, -1)
+    total = np.abs(diff_prev) + np.abs(diff_next)
+    norm_diff = np.abs(diff_next) / np.where(total != 0, total, 1)
+    eased = values.copy()
+    eased[1:-1] += easing_function(norm_diff) * direction * (np.abs(diff_next) / 2)
+    return eased
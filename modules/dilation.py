@@ -0,0 +1,858 @@
+import collections
+import functools
+import threading
+import numpy as np
+import cv2
+import torch
+import torch.nn.functional as F
+from .frame_dedup import dedup_ratio, first_occurrences, packed_digest
+from .frame_sink import to_uint8_frames
+from .parallel import frame_chunks, map_frames, resolve_workers
+from .torch_dilation import dilate_batch, first_covered_frame, mask_sources, shape_error
+
+# Distance-transform dilation engine shared by the mask dilation nodes.
+#
+# Dilating a binary mask by a radius r is the same as keeping every pixel whose
+# distance to the nearest mask pixel is <= r. Computing that distance once per
+# distinct mask frame turns every dilation into a single threshold, so the cost
+# per frame no longer depends on the radius and circles come out exact.
+
+SHAPES = ["circle", "square"]
+
+# Bound on the number of structuring elements kept alive by the kernel cache.
+KERNEL_CACHE_SIZE = 128
+
+# Largest radius for which dilating a frame once with a kernel is cheaper than a
+# full distance transform of that frame.
+DIRECT_DILATE_MAX_RADIUS = {"circle": 12, "square": 64}
+
+# Preview scales offered by the dilation nodes, mapped to their downscale factor.
+PREVIEW_SCALES = {"1": 1, "1/2": 2, "1/4": 4, "1/8": 8}
+
+# Distinct frames whose local distance fields dilate_into holds at once (at least one per worker).
+FIELD_CHUNK_SIZE = 16
+
+def binarize_mask(mask):
+    """Convert a MASK tensor or array of shape [B, H, W] (or [H, W]) to a binary uint8 stack."""
+    if isinstance(mask, torch.Tensor):
+        mask = mask.cpu().numpy()
+    mask = np.asarray(mask)
+    if mask.ndim == 2:
+        mask = mask[np.newaxis]
+    return (mask > 0).astype(np.uint8)
+
+def downscale_masks(masks, factor):
+    """Shrink a binary [B, H, W] stack by factor; a block is set when any of its pixels is."""
+    if factor == 1:
+        return masks
+    count, height, width = masks.shape
+    padded = np.zeros((count, -(-height // factor) * factor, -(-width // factor) * factor), dtype=masks.dtype)
+    padded[:, :height, :width] = masks
+    blocks = padded.reshape(count, padded.shape[1] // factor, factor, padded.shape[2] // factor, factor)
+    return blocks.max(axis=(2, 4))
+
+class PackedMasks:
+    """
+    Binary [B, H, W] mask stack stored bit-packed along rows (np.packbits).
+
+    Indexing a frame unpacks it to a uint8 0/1 array, so code that reads one frame
+    at a time works unchanged while the stack takes 1/8 of a uint8 copy and 1/32
+    of the float32 MASK it came from.
+    """
+    def __init__(self, packed, width):
+        self.packed = packed
+        self.shape = packed.shape[:2] + (width,)
+
+    @classmethod
+    def pack(cls, masks):
+        """Pack a [B, H, W] array, any non-zero pixel counting as set."""
+        masks = np.asarray(masks)
+        return cls(np.packbits(masks > 0, axis=-1), masks.shape[-1])
+
+    @classmethod
+    def from_mask(cls, mask, factor=1, chunk_size=16):
+        """Binarize, downscale by factor and pack a MASK chunk by chunk, never holding a full unpacked copy."""
+        if mask.ndim == 2:
+            mask = mask[None]
+        num_frames, height, width = mask.shape
+        chunks = [
+            np.packbits(downscale_masks(binarize_mask(mask[start:end]), factor), axis=-1)
+            for start, end in frame_chunks(num_frames, chunk_size)
+        ]
+        height, width = -(-height // factor), -(-width // factor)
+        if not chunks:
+            return cls(np.zeros((0, height, -(-width // 8)), dtype=np.uint8), width)
+        return cls(np.concatenate(chunks), width)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return np.unpackbits(self.packed[index], axis=-1, count=self.shape[2])
+
+    def downscaled(self, factor, chunk_size=16):
+        """Copy shrunk by factor as in downscale_masks, unpacked chunk by chunk."""
+        if factor == 1:
+            return self
+        chunks = [
+            np.packbits(downscale_masks(self[start:end], factor), axis=-1)
+            for start, end in frame_chunks(len(self), chunk_size)
+        ]
+        height, width = -(-self.shape[1] // factor), -(-self.shape[2] // factor)
+        if not chunks:
+            return PackedMasks(np.zeros((0, height, -(-width // 8)), dtype=np.uint8), width)
+        return PackedMasks(np.concatenate(chunks), width)
+
+def upscale_frames(frames, factor, height, width, channels_last=False):
+    """Nearest-neighbour upscale of [..., h, w] (or [..., h, w, C]) frames back to height x width."""
+    if factor == 1:
+        return frames
+    if channels_last:
+        return frames.repeat(factor, axis=-3).repeat(factor, axis=-2)[..., :height, :width, :]
+    return frames.repeat(factor, axis=-2).repeat(factor, axis=-1)[..., :height, :width]
+
+def preview_error(factor, backend="opencv", shape="circle", radius=0):
+    """
+    Largest boundary shift in pixels between a preview and the exact full-resolution dilation.
+
+    Pixel and mask positions each move by up to half a block diagonal when snapped
+    to the preview grid. The torch backend also floors radii to whole preview
+    pixels, losing up to one more block, and approximates circles by octagons,
+    whose error (shape_error) grows with the largest radius. The shift is a
+    Euclidean distance for either shape.
+    """
+    error = (factor - 1) * np.sqrt(2)
+    if backend == "torch":
+        error += factor - 1 + shape_error(shape, radius / factor) * factor
+    return float(error)
+
+@functools.lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _build_structuring_element(shape, size):
+    if shape == "circle":
+        # A disc kernel only depends on floor(radius^2), so size is that integer.
+        radius = int(np.sqrt(size))
+        y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+        kernel = (x * x + y * y <= size).astype(np.uint8)
+    else:
+        kernel = np.ones((2 * size + 1, 2 * size + 1), dtype=np.uint8)
+    kernel.flags.writeable = False
+    return kernel
+
+def structuring_element(shape, radius):
+    """
+    Read-only structuring element for a radius, shared through a bounded LRU cache.
+
+    The kernel matches the distance threshold exactly: a disc of pixels with
+    x^2 + y^2 <= radius^2 for "circle", a (2r + 1) square for "square".
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unsupported dilation shape '{shape}', expected one of {SHAPES}.")
+    radius = max(radius, 0)
+    size = int(radius * radius) if shape == "circle" else int(radius)
+    return _build_structuring_element(shape, size)
+
+def kernel_cache_info():
+    """Hit/miss counters of the shared structuring element cache."""
+    return _build_structuring_element.cache_info()
+
+FieldCacheInfo = collections.namedtuple("FieldCacheInfo", ["hits", "misses"])
+
+_field_counts = [0, 0]
+_field_counts_lock = threading.Lock()
+
+def count_field_uses(hits=0, misses=0):
+    """Record dilations read off an existing distance field (hits) and distance transforms computed (misses)."""
+    with _field_counts_lock:
+        _field_counts[0] += hits
+        _field_counts[1] += misses
+
+def field_cache_info():
+    """Hit/miss counters of distance field reuse across all MaskDistanceFields."""
+    with _field_counts_lock:
+        return FieldCacheInfo(*_field_counts)
+
+def cache_info():
+    """Snapshot of the field and kernel counters, for cache_report."""
+    return field_cache_info(), kernel_cache_info()
+
+def cache_report(before):
+    """Distance fields and structuring elements reused and built since the before snapshot of cache_info(), for a node output."""
+    fields_before, kernels_before = before
+    fields, kernels = cache_info()
+    return (
+        f"fields reused: {fields.hits - fields_before.hits}, computed: {fields.misses - fields_before.misses}; "
+        f"kernels reused: {kernels.hits - kernels_before.hits}, built: {kernels.misses - kernels_before.misses}, cached: {kernels.currsize}/{kernels.maxsize}"
+    )
+
+def distance_transform(mask_frame, shape="circle"):
+    """
+    Distance from every pixel to the nearest mask pixel.
+
+    "circle" uses the exact Euclidean distance, "square" the chessboard distance.
+    Mask pixels are 0, and an empty mask is infinitely far away.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unsupported dilation shape '{shape}', expected one of {SHAPES}.")
+    if not mask_frame.any():
+        return np.full(mask_frame.shape, np.inf, dtype=np.float32)
+
+    background = (mask_frame == 0).astype(np.uint8)
+    if shape == "circle":
+        return cv2.distanceTransform(background, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    return cv2.distanceTransform(background, cv2.DIST_C, 3)
+
+def feather_alpha(distances, radius, feather):
+    """
+    Soft coverage of a dilation: 1 within radius, fading linearly to 0 over the next feather pixels.
+
+    radius and feather may be arrays that broadcast against distances; pixels
+    with a feather of 0 get the hard 0/1 threshold.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        soft = np.clip((radius + feather - distances) / feather, 0.0, 1.0)
+    return np.where(np.asarray(feather) > 0, soft, distances <= radius).astype(np.float32)
+
+def mask_bbox(mask_frame):
+    """(top, bottom, left, right) inclusive bounds of the set pixels, or None for an empty frame."""
+    left, top, width, height = cv2.boundingRect(mask_frame)
+    if width == 0:
+        return None
+    return top, top + height - 1, left, left + width - 1
+
+def grow_bbox(bbox, radius, height, width):
+    """
+    Slices of a bounding box grown by radius and clipped to a height x width frame.
+
+    A pixel within distance r of the mask is at most floor(r) rows and columns
+    away from it in either metric, so the grown box holds the whole dilation.
+    """
+    reach = int(max(radius, 0))
+    top, bottom, left, right = bbox
+    return (
+        slice(max(top - reach, 0), min(bottom + reach + 1, height)),
+        slice(max(left - reach, 0), min(right + reach + 1, width)),
+    )
+
+def field_nbytes(field):
+    """Bytes held by a cached field, or by every array of a tuple of them."""
+    if isinstance(field, tuple):
+        return sum(part.nbytes for part in field)
+    return field.nbytes
+
+class FieldCache:
+    """
+    Per-frame fields by source frame, dropping the least recently used ones beyond limit bytes.
+
+    A limit of None keeps every field. The most recent field always stays, and
+    lookups and inserts are safe from the worker threads.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.nbytes = 0
+        self._fields = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, source):
+        return source in self._fields
+
+    def keys(self):
+        with self._lock:
+            return list(self._fields)
+
+    def get(self, source):
+        with self._lock:
+            field = self._fields.get(source)
+            if field is not None:
+                self._fields.move_to_end(source)
+            return field
+
+    def put(self, source, field):
+        with self._lock:
+            if source in self._fields:
+                self.nbytes -= field_nbytes(self._fields.pop(source))
+            self._fields[source] = field
+            self.nbytes += field_nbytes(field)
+            while self.limit is not None and self.nbytes > self.limit and len(self._fields) > 1:
+                _, evicted = self._fields.popitem(last=False)
+                self.nbytes -= field_nbytes(evicted)
+
+class MaskDistanceFields:
+    """
+    Lazily computes one distance transform per distinct mask frame.
+
+    Frames past the end of the batch reuse the last mask frame, and identical
+    frames anywhere in the batch (matched by content hash) share the same field. A frame that is only dilated once by a
+    small radius is dilated directly with a cached kernel instead.
+
+    Dilations only touch the region of interest, the mask's bounding box grown by
+    the radius; everything outside it stays zero. The same box gives a cheap
+    lower bound on the radius that covers the whole frame.
+
+    The masks are kept bit-packed and unpacked one frame at a time when read.
+    With a store (a precomputed DistanceField of the same masks) fields are
+    decoded from it instead of computed.
+
+    Computed fields are kept in a FieldCache; setting cache_limit (bytes) bounds
+    it, and fields dropped from it are computed again when next needed.
+    """
+    def __init__(self, masks, shape="circle", store=None):
+        if not isinstance(masks, PackedMasks):
+            masks = PackedMasks.pack(masks)
+        self.masks = masks
+        self.shape = shape
+        self.store = store
+        self._fields = FieldCache()
+        self._sources = first_occurrences(packed_digest(packed) for packed in masks.packed)
+        self._direct_dilations = set()
+        self._max_distances = {}
+        self._bboxes = {}
+
+    def __len__(self):
+        return self.masks.shape[0]
+
+    def source_index(self, index):
+        return self._sources[min(index, len(self) - 1)]
+
+    @property
+    def cache_limit(self):
+        """Largest number of bytes of fields kept between uses, None for no limit."""
+        return self._fields.limit
+
+    @cache_limit.setter
+    def cache_limit(self, limit):
+        self._fields.limit = limit
+
+    def _compute_field(self, source):
+        if self.store is not None:
+            count_field_uses(hits=1)
+            return self.store.field(source)
+        count_field_uses(misses=1)
+        return distance_transform(self.masks[source], self.shape)
+
+    def field(self, index):
+        source = self.source_index(index)
+        field = self._fields.get(source)
+        if field is not None:
+            count_field_uses(hits=1)
+        else:
+            field = self._compute_field(source)
+            self._max_distances.setdefault(source, float(field.max()))
+            self._fields.put(source, field)
+        return field
+
+    def max_distance(self, index):
+        """Largest distance to the mask in the frame, i.e. the radius that covers it fully."""
+        source = self.source_index(index)
+        if source not in self._max_distances:
+            self._max_distances[source] = float(self.field(index).max())
+        return self._max_distances[source]
+
+    def bbox(self, index):
+        """Bounding box of the mask at index, or None for an empty mask."""
+        source = self.source_index(index)
+        if source not in self._bboxes:
+            self._bboxes[source] = mask_bbox(self.masks[source])
+        return self._bboxes[source]
+
+    def roi(self, index, radius):
+        """Slices of the region a dilation by radius can reach, or None for an empty mask."""
+        bbox = self.bbox(index)
+        if bbox is None:
+            return None
+        return grow_bbox(bbox, radius, *self.masks.shape[1:3])
+
+    def min_cover_radius(self, index):
+        """Smallest radius whose region of interest spans the whole frame (inf for an empty mask)."""
+        bbox = self.bbox(index)
+        if bbox is None:
+            return np.inf
+        height, width = self.masks.shape[1:3]
+        top, bottom, left, right = bbox
+        return float(max(top, height - 1 - bottom, left, width - 1 - right))
+
+    def covers(self, index, radius):
+        """True when a dilation by radius covers the whole frame."""
+        return radius >= self.min_cover_radius(index) and radius >= self.max_distance(index)
+
+    def compute_fields(self, indices, workers=1):
+        """Compute the fields of the given frames up front, in parallel (only the last ones stay with a cache_limit)."""
+        missing = sorted({self.source_index(index) for index in indices} - set(self._fields.keys()))
+        map_frames(lambda source: self.field(source) is None, missing, workers)
+
+    def _use_direct(self, source, radius):
+        return self.store is None and source not in self._fields and source not in self._direct_dilations and radius <= DIRECT_DILATE_MAX_RADIUS[self.shape]
+
+    def _dilate_direct(self, source, region, radius):
+        crop = self.masks[source][region]
+        if radius <= 0:
+            return crop
+        return cv2.dilate(crop, structuring_element(self.shape, radius))
+
+    def dilate_into(self, out, indices, radii, workers=1, feather=0):
+        """
+        Write out[index] = frame dilated by radius for every (index, radius) pair.
+
+        Fields are computed once per distinct frame and each distinct
+        (frame, radius) pair is dilated once on a thread pool, then scattered to
+        every index that asks for it. A field that is not cached yet is only
+        computed over the region of interest of the frame's largest radius; it
+        is exact there because every mask pixel lies inside that region. Frames
+        whose radius covers the whole frame are filled without thresholding.
+        Distinct frames are processed FIELD_CHUNK_SIZE (or one per worker) at a
+        time, so only their local fields are held at once.
+
+        With feather > 0 the edges fade out over feather pixels (see
+        feather_alpha) and out has to be a float array.
+        """
+        pairs = {}
+        for index, radius in zip(indices, radii):
+            pairs.setdefault((self.source_index(index), radius), []).append(index)
+        items_per_source = {}
+        for item in pairs.items():
+            items_per_source.setdefault(item[0][0], []).append(item)
+        radii_per_source = {source: [radius for (_, radius), _ in items] for source, items in items_per_source.items()}
+        direct = {source for source, source_radii in radii_per_source.items()
+                  if len(source_radii) == 1 and self._use_direct(source, source_radii[0]) and feather <= 0}
+        regions = {source: self.roi(source, max(source_radii) + feather) for source, source_radii in radii_per_source.items()
+                   if source not in direct}
+        full_frame = tuple(slice(0, size) for size in self.masks.shape[1:3])
+
+        def local_field(source):
+            # The frame's field over its region, from the cache, the store or a local distance transform
+            region = regions[source]
+            uses = len(items_per_source[source])
+            field = self._fields.get(source)
+            if field is not None:
+                count_field_uses(hits=uses)
+                return field[region]
+            if self.store is not None:
+                count_field_uses(hits=uses)
+                return self.store.field(source)[region]
+            # Only the first dilation pays for the distance transform
+            count_field_uses(hits=uses - 1, misses=1)
+            return distance_transform(self.masks[source][region], self.shape)
+
+        def dilate_pair(item):
+            (source, radius), targets = item
+            region = self.roi(source, radius + feather)
+            if region is None:
+                dilated = None
+            elif source not in direct and self.covers(source, radius):
+                region, dilated = full_frame, 1
+            elif source in direct:
+                dilated = self._dilate_direct(source, region, radius)
+            else:
+                outer = regions[source]
+                inner = tuple(slice(r.start - o.start, r.stop - o.start) for r, o in zip(region, outer))
+                dilated = self._threshold(local_fields[source][inner], radius, feather)
+            for index in targets:
+                if region != full_frame:
+                    out[index] = 0
+                if dilated is not None:
+                    out[index][region] = dilated
+
+        sources = list(radii_per_source)
+        for start, end in frame_chunks(len(sources), max(FIELD_CHUNK_SIZE, resolve_workers(workers))):
+            chunk = sources[start:end]
+            missing = [source for source in chunk if regions.get(source) is not None]
+            local_fields = dict(zip(missing, map_frames(local_field, missing, workers)))
+            for source, field in local_fields.items():
+                # A frame can only be covered when its region spans the whole frame
+                if regions[source] == full_frame:
+                    self._max_distances.setdefault(source, float(field.max()))
+            map_frames(dilate_pair, [item for source in chunk for item in items_per_source[source]], workers)
+        self._direct_dilations.update(direct)
+
+    @staticmethod
+    def _threshold(field, radius, feather):
+        if feather > 0:
+            return feather_alpha(field, radius, feather)
+        return field <= radius
+
+    def dedup_ratio(self, indices, radii=None):
+        """Requested frames per distinct (frame, radius) pair, or per distinct frame without radii."""
+        indices = list(indices)
+        if radii is None:
+            unique = {self.source_index(index) for index in indices}
+        else:
+            unique = {(self.source_index(index), radius) for index, radius in zip(indices, radii)}
+        return dedup_ratio(len(indices), len(unique))
+
+    def first_covered(self, indices, radii):
+        """First of the given frames whose radius covers the whole frame, or -1 if none does."""
+        for index, radius in sorted(zip(indices, radii)):
+            if self.covers(index, radius):
+                return index
+        return -1
+
+    def is_static(self, num_frames=None):
+        """True when every frame up to num_frames shares the first frame's mask."""
+        count = len(self) if num_frames is None else min(num_frames, len(self))
+        # Sources are global first occurrences, so a frame equal to frame 0 may follow different ones
+        return all(source == 0 for source in self._sources[:count])
+
+def dilate_mask_frames(mask, indices, radii, shape="circle", backend="opencv", workers=0, preview_factor=1, feather=0, distance_field=None):
+    """
+    Dilate the given frames of a MASK tensor, leaving the other frames untouched.
+
+    With preview_factor > 1 the frames are dilated at reduced resolution with
+    radii scaled to match, then upscaled with nearest-neighbour. The torch
+    backend stays on the mask's device: identical frames are matched there and
+    the coverage frame is read off its own (octagon) dilations.
+
+    A feathered dilation is read off the same distance fields as the hard one,
+    so it always runs on the opencv path whatever the backend.
+
+    With a precomputed DistanceField of the mask the shape comes from it and
+    the full-resolution opencv path reads its fields instead of recomputing them.
+
+    Args:
+    - mask (torch.Tensor): The mask batch of shape [B, H, W].
+    - indices (list of int): Frames to dilate.
+    - radii (list of float): Radius for each of those frames.
+    - shape (str): "circle" or "square".
+    - backend (str): "opencv" for exact distance-transform dilation, "torch" for pooling on the mask's device.
+    - workers (int): Threads for the opencv backend (0 uses every core).
+    - preview_factor (int): Downscale factor of the preview resolution.
+    - feather (float): Width in pixels over which the dilated edges fade out, 0 for hard edges.
+    - distance_field (DistanceField): Precomputed fields of mask, used in place of shape.
+
+    Returns:
+    - torch.Tensor: The float32 mask batch with the selected frames dilated.
+    - int: First dilated frame that is fully covered, -1 if none is.
+    - float: Dedup ratio, dilations requested per distinct (frame, radius) pair.
+    """
+    if distance_field is not None:
+        shape = distance_field.shape
+    indices = list(indices)
+    radii = [radius / preview_factor for radius in radii]
+    feather = feather / preview_factor
+    height, width = mask.shape[1:3]
+
+    def mask_fields():
+        if distance_field is not None:
+            return distance_field.mask_fields(preview_factor)
+        return MaskDistanceFields(PackedMasks.from_mask(mask, preview_factor), shape)
+
+    if backend == "torch" and feather <= 0:
+        result = mask.to(torch.float32, copy=True)
+        if indices:
+            frames = mask[indices]
+            if preview_factor > 1:
+                frames = F.max_pool2d((frames > 0).to(torch.float32).unsqueeze(1), preview_factor, ceil_mode=True)[:, 0]
+            dilated = dilate_batch(frames, radii, shape)
+            sources = mask_sources(frames)
+            coverage_frame = first_covered_frame(dilated, indices, radii, sources, shape)
+            if preview_factor > 1:
+                dilated = dilated.repeat_interleave(preview_factor, 1).repeat_interleave(preview_factor, 2)[:, :height, :width]
+            result[indices] = dilated
+        else:
+            coverage_frame, sources = -1, []
+        return result, coverage_frame, dedup_ratio(len(indices), len(set(zip(sources, radii))))
+
+    dup = mask.cpu().numpy().astype(np.float32)
+    fields = mask_fields()
+    if preview_factor == 1:
+        fields.dilate_into(dup, indices, radii, workers, feather)
+    else:
+        preview = np.zeros(fields.masks.shape, dtype=np.float32 if feather > 0 else np.uint8)
+        fields.dilate_into(preview, indices, radii, workers, feather)
+        for index in indices:
+            dup[index] = upscale_frames(preview[index], preview_factor, height, width)
+    return torch.from_numpy(dup), fields.first_covered(indices, radii), fields.dedup_ratio(indices, radii)
+
+def label_dtype(num_labels):
+    """Smallest unsigned dtype that can hold num_labels distinct labels."""
+    return np.uint8 if num_labels <= np.iinfo(np.uint8).max + 1 else np.uint16
+
+def layer_radius(start_frame, speed, index):
+    """Radius of a linearly growing layer at a frame, or None before it starts."""
+    if index < start_frame:
+        return None
+    return speed * (index - start_frame + 1)
+
+def activation_map(field, start_frame, speed, num_frames):
+    """
+    Frame at which each pixel of a linearly growing layer over a static mask turns on.
+
+    A pixel turns on at the first frame whose radius reaches its distance, i.e.
+    start_frame + ceil(distance / speed) - 1. Pixels that never turn on within
+    num_frames are set to num_frames.
+    """
+    dtype = np.uint16 if num_frames < np.iinfo(np.uint16).max else np.int32
+    first_frame = np.ceil(start_frame)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if speed > 0:
+            frames = np.maximum(np.ceil(start_frame - 1 + field / speed), first_frame)
+        else:
+            frames = np.where(field <= 0, first_frame, np.inf)
+    frames = np.minimum(frames, num_frames)
+    return frames.astype(dtype)
+
+class LayerRenderer:
+    """
+    Renders linearly growing dilation layers as per-frame label maps.
+
+    Label 0 is the background and label i + 1 is layers[i]; later layers are drawn
+    on top of earlier ones. For a static mask each layer is stored as a single
+    activation-frame map, so memory is O(layers x H x W) instead of a full
+    per-layer frame stack. Moving masks are thresholded frame by frame.
+
+    Once a layer covers the whole frame everything below it is invisible, so
+    layers under the topmost covering layer are neither thresholded nor
+    composited, and static-mask layers that are covered before they ever show
+    never get an activation map at all.
+
+    Layers may carry a feather width as a fourth element. When any layer does,
+    the renderer is feathered and composite_layers asks it for colors() instead
+    of labels(): every layer is alpha-blended over the ones below it with
+    feather_alpha of the distance field, in the same pass.
+
+    When the fields have a cache_limit, moving-mask fields are computed chunk
+    by chunk as frames are rendered rather than all up front, and a static mask
+    whose activation maps would not fit thresholds its field directly.
+    """
+    def __init__(self, fields, layers, num_frames):
+        self.fields = fields
+        self.layers = layers
+        self.num_frames = num_frames
+        self.static = fields.is_static(num_frames)
+        self.label_dtype = label_dtype(len(layers) + 1)
+        self._starts = np.array([layer[0] for layer in layers], dtype=np.float64)
+        self._speeds = np.array([layer[1] for layer in layers], dtype=np.float64)
+        self._feathers = np.array([layer[3] if len(layer) > 3 else 0.0 for layer in layers], dtype=np.float64)
+        self.feathered = bool((self._feathers > 0).any())
+        self._activations = {}
+        self.use_activations = self.static
+
+    def activation(self, layer_index):
+        if layer_index not in self._activations:
+            self._activations[layer_index] = self.activation_for_layer(layer_index)
+        return self._activations[layer_index]
+
+    def activation_for_layer(self, layer_index):
+        start_frame, speed = self.layers[layer_index][:2]
+        return activation_map(self.fields.field(0), start_frame, speed, self.num_frames)
+
+    def covering_layer(self, index):
+        """Topmost layer covering the whole frame at index, or -1 if there is none."""
+        if not self.layers:
+            return -1
+        radii = self._speeds * (index - self._starts + 1)
+        candidates = (index >= self._starts) & (radii >= self.fields.min_cover_radius(index))
+        if not candidates.any():
+            return -1
+        covering = np.flatnonzero(candidates & (radii >= self.fields.max_distance(index)))
+        return int(covering[-1]) if len(covering) else -1
+
+    def coverage_frames(self):
+        """
+        First frame at which each layer covers the whole frame, num_frames if it never does.
+
+        For a static mask this follows from the largest distance to the mask. A
+        moving mask is checked frame by frame, where the bounding box bound rules
+        out most frames before any field is needed.
+        """
+        first_frames = np.ceil(self._starts)
+        if self.static:
+            max_distance = self.fields.max_distance(0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cover_frames = np.where(
+                    self._speeds > 0,
+                    np.maximum(first_frames, np.ceil(self._starts - 1 + max_distance / self._speeds)),
+                    np.where(max_distance <= 0, first_frames, np.inf),
+                )
+            return np.minimum(cover_frames, self.num_frames)
+
+        cover_frames = np.full(len(self.layers), float(self.num_frames))
+        for layer_index, (start_frame, speed) in enumerate(zip(self._starts, self._speeds)):
+            for index in range(max(int(first_frames[layer_index]), 0), self.num_frames):
+                if self.fields.covers(index, layer_radius(start_frame, speed, index)):
+                    cover_frames[layer_index] = index
+                    break
+        return cover_frames
+
+    def coverage_frame(self):
+        """First frame that some layer covers completely, or -1 if none does."""
+        if not self.layers:
+            return -1
+        first = int(self.coverage_frames().min())
+        return first if first < self.num_frames else -1
+
+    def visible_layers(self):
+        """Layers of a static mask that are not covered by a later layer before they start."""
+        first_frames = np.ceil(self._starts)
+        # Frame from which some later layer covers everything
+        hidden_from = np.minimum.accumulate(self.coverage_frames()[::-1])[::-1]
+        hidden_from = np.append(hidden_from[1:], np.inf)
+        return [i for i in range(len(self.layers)) if hidden_from[i] > first_frames[i] and first_frames[i] < self.num_frames]
+
+    def prepare(self, workers=1):
+        """Compute the fields and activation maps up front so labels() only reads them."""
+        limit = self.fields.cache_limit
+        if self.static:
+            field = self.fields.field(0)
+            if self.feathered:
+                # colors() blends straight from the field
+                return
+            missing = [i for i in self.visible_layers() if i not in self._activations]
+            activation_bytes = len(missing) * field.size * np.dtype(np.uint16 if self.num_frames < np.iinfo(np.uint16).max else np.int32).itemsize
+            if limit is not None and field.nbytes + activation_bytes > limit:
+                self.use_activations = False
+                return
+            self._activations.update(zip(missing, map_frames(self.activation_for_layer, missing, workers)))
+        elif limit is None:
+            self.fields.compute_fields(range(self.num_frames), workers)
+
+    def labels(self, index, out=None):
+        """Label map for a frame, optionally written into a preallocated array."""
+        if out is None:
+            height, width = self.fields.masks.shape[1:3]
+            labels = np.zeros((height, width), dtype=self.label_dtype)
+        else:
+            labels = out
+        top = self.covering_layer(index)
+        labels[:] = top + 1
+        field = None
+        for layer_index in range(top + 1, len(self.layers)):
+            start_frame, speed = self.layers[layer_index][:2]
+            radius = layer_radius(start_frame, speed, index)
+            if radius is None:
+                continue
+            region = self.fields.roi(index, radius)
+            if region is None:
+                continue
+            if self.use_activations:
+                active = self.activation(layer_index)[region] <= index
+            else:
+                if field is None:
+                    field = self.fields.field(index)
+                active = field[region] <= radius
+            labels[region][active] = layer_index + 1
+        return labels
+
+    def colors(self, index, palette, out=None):
+        """
+        Float RGB frame with feathered layer edges, optionally written into a preallocated array.
+
+        palette[0] is the background and palette[i + 1] the color of layers[i].
+        A layer that covers the whole frame is opaque everywhere, so the layers
+        under it are skipped as in labels().
+        """
+        if out is None:
+            height, width = self.fields.masks.shape[1:3]
+            out = np.empty((height, width, 3), dtype=np.float32)
+        top = self.covering_layer(index)
+        out[:] = palette[top + 1]
+        field = None
+        for layer_index in range(top + 1, len(self.layers)):
+            start_frame, speed = self.layers[layer_index][:2]
+            radius = layer_radius(start_frame, speed, index)
+            if radius is None:
+                continue
+            feather = self._feathers[layer_index]
+            region = self.fields.roi(index, radius + feather)
+            if region is None:
+                continue
+            if field is None:
+                field = self.fields.field(index)
+            alpha = feather_alpha(field[region], radius, feather)
+            target = out[region]
+            target += alpha[..., None] * (palette[layer_index + 1] - target)
+        return out
+
+def composite_layers(renderer, background_color, subject_masks=None, subject_color=None, chunk_size=16, workers=1, out=None, preview_factor=1, sink=None, frame_size=None):
+    """
+    Composite rendered layers into a float32 IMAGE tensor of shape [frames, H, W, 3].
+
+    Each chunk of frames becomes a label map (background, layers, then the subject
+    on top) that is turned into colors with a single palette gather written
+    straight into the preallocated output. Chunks are rendered on a thread pool.
+    The result is written into out when given, e.g. a disk-backed frame buffer.
+    A renderer working at preview resolution has its label maps upscaled by
+    preview_factor; the subject is always drawn at full resolution.
+
+    With a FrameSink the chunks are rendered as uint8 and streamed to it in
+    order instead, so at most one chunk per worker is in memory, and only the
+    last frame is returned. frame_size is the (height, width) of the output when
+    there is no out to take it from.
+
+    A feathered renderer blends soft layer edges itself, so its chunks are
+    rendered with renderer.colors() rather than through label maps.
+    """
+    num_frames = renderer.num_frames
+    if out is not None:
+        height, width = out.shape[1:3]
+    elif frame_size is not None:
+        height, width = frame_size
+    else:
+        height, width = (size * preview_factor for size in renderer.fields.masks.shape[1:3])
+    colors = [background_color] + [layer[2] for layer in renderer.layers]
+    subject_label = None
+    if subject_masks is not None:
+        subject_label = len(colors)
+        colors.append(subject_color)
+    palette = np.array(colors, dtype=np.float32) / 255.0
+    dtype = label_dtype(len(colors))
+    renderer.prepare(workers)
+
+    def chunk_labels_for(chunk):
+        chunk_start, chunk_end = chunk
+        chunk_labels = np.zeros((chunk_end - chunk_start,) + renderer.fields.masks.shape[1:3], dtype=dtype)
+        for offset, index in enumerate(range(chunk_start, chunk_end)):
+            renderer.labels(index, out=chunk_labels[offset])
+        chunk_labels = upscale_frames(chunk_labels, preview_factor, height, width)
+        if subject_label is not None:
+            for offset, index in enumerate(range(chunk_start, chunk_end)):
+                chunk_labels[offset][subject_masks[min(index, len(subject_masks) - 1)] > 0] = subject_label
+        return chunk_labels
+
+    def chunk_colors_for(chunk, out=None):
+        chunk_start, chunk_end = chunk
+        if out is not None and preview_factor == 1:
+            chunk_colors = out
+        else:
+            chunk_colors = np.empty((chunk_end - chunk_start,) + renderer.fields.masks.shape[1:3] + (3,), dtype=np.float32)
+        for offset, index in enumerate(range(chunk_start, chunk_end)):
+            renderer.colors(index, palette, out=chunk_colors[offset])
+        chunk_colors = upscale_frames(chunk_colors, preview_factor, height, width, channels_last=True)
+        if out is not None and chunk_colors is not out:
+            out[:] = chunk_colors
+            chunk_colors = out
+        if subject_label is not None:
+            for offset, index in enumerate(range(chunk_start, chunk_end)):
+                chunk_colors[offset][subject_masks[min(index, len(subject_masks) - 1)] > 0] = palette[subject_label]
+        return chunk_colors
+
+    feathered = getattr(renderer, "feathered", False)
+
+    if sink is not None:
+        palette_uint8 = np.array(colors, dtype=np.uint8)
+        chunks = frame_chunks(num_frames, chunk_size)
+        step = resolve_workers(workers)
+        last_frame = np.zeros((0, height, width, 3), dtype=np.uint8)
+
+        def render_chunk(chunk):
+            if feathered:
+                return to_uint8_frames(chunk_colors_for(chunk))
+            return palette_uint8[chunk_labels_for(chunk)]
+
+        for start in range(0, len(chunks), step):
+            rendered = map_frames(render_chunk, chunks[start:start + step], workers)
+            for frames in rendered:
+                sink.write(frames)
+            last_frame = rendered[-1][-1:]
+        return torch.from_numpy(last_frame.astype(np.float32) / 255.0)
+
+    result = torch.empty((num_frames, height, width, 3), dtype=torch.float32) if out is None else out
+    result_np = result.numpy()
+
+    def composite_chunk(chunk):
+        chunk_start, chunk_end = chunk
+        if feathered:
+            chunk_colors_for(chunk, out=result_np[chunk_start:chunk_end])
+        else:
+            np.take(palette, chunk_labels_for(chunk), axis=0, out=result_np[chunk_start:chunk_end])
+
+    map_frames(composite_chunk, frame_chunks(num_frames, chunk_size), workers)
+    return result
@@ -0,0 +1,97 @@
+import re
+import numpy as np
+
+# Structured dilation schedules passed between nodes as DILATION_SCHEDULE.
+#
+# A schedule is a set of linearly growing layers, each with a start frame, a
+# speed in pixels per frame, an RGB color and a feather width in pixels (0 for
+# a hard edge), stored as parallel arrays. Start frames stay floats, so nothing
+# is lost between the node that builds a schedule and the node that renders it.
+# The string form "(start_frame, dilation_speed, (r, g, b))," is still accepted
+# and produced, with an optional feather width after the color.
+
+SCHEDULE_PATTERN = r'\(\s*(\d*\.?\d*)\s*,\s*(\d*\.?\d+)\s*,\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)\s*(?:,\s*(\d*\.?\d+)\s*)?\)\s*,?'
+
+class DilationSchedule:
+    """
+    Dilation layers as arrays of start frames, speeds, colors and feather widths.
+
+    Args:
+    - starts (array-like): Start frame of each layer (fractional frames allowed).
+    - speeds (array-like): Dilation speed of each layer in pixels per frame.
+    - colors (array-like): RGB color of each layer, shape [layers, 3].
+    - feathers (array-like): Feather width of each layer in pixels, None for hard edges everywhere.
+    """
+    def __init__(self, starts, speeds, colors, feathers=None):
+        self.starts = np.asarray(starts, dtype=np.float64).reshape(-1)
+        self.speeds = np.asarray(speeds, dtype=np.float64).reshape(-1)
+        self.colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        if feathers is None:
+            feathers = np.zeros(len(self.starts))
+        self.feathers = np.asarray(feathers, dtype=np.float64).reshape(-1)
+        if not len(self.starts) == len(self.speeds) == len(self.colors) == len(self.feathers):
+            raise ValueError("starts, speeds, colors and feathers must have one entry per layer.")
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_string(cls, schedule_str, feather=0.0):
+        """
+        Parse the "(start_frame, dilation_speed, (r, g, b)[, feather])," string form.
+
+        Layers without a feather width of their own get feather.
+        """
+        matches = re.findall(SCHEDULE_PATTERN, schedule_str)
+        if not matches:
+            raise ValueError("No valid matches found in the provided schedule string.")
+        values = np.array([[float(value) for value in match[:5]] for match in matches])
+        feathers = [float(match[5]) if match[5] else feather for match in matches]
+        return cls(values[:, 0], values[:, 1], values[:, 2:], feathers)
+
+    @classmethod
+    def from_triggers(cls, values, threshold, speed, colors, first_frame=0):
+        """
+        One layer per rising edge of values above threshold, cycling through colors.
+
+        A layer starts at every frame above the threshold whose previous frame was
+        not, including the first frame. values[0] is frame first_frame.
+        """
+        above = np.asarray(values, dtype=np.float64).reshape(-1) > threshold
+        starts = np.flatnonzero(above & ~np.concatenate(([False], above[:-1]))) + first_frame
+        return cls.from_frames(starts, speed, colors)
+
+    @classmethod
+    def from_frames(cls, frames, speed, colors):
+        """One layer starting at each trigger frame, cycling through colors."""
+        starts = np.asarray(frames, dtype=np.float64).reshape(-1)
+        palette = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        return cls(starts, np.full(len(starts), speed), palette[np.arange(len(starts)) % len(palette)])
+
+    def to_string(self):
+        """The schedule in the "(start_frame, dilation_speed, (r, g, b))," string form."""
+        def number(value):
+            return np.format_float_positional(value, trim="-")
+        return "".join(
+            f"({number(start)}, {number(speed)}, ({r}, {g}, {b}){f', {number(feather)}' if feather > 0 else ''}),"
+            for start, speed, (r, g, b), feather in zip(self.starts, self.speeds, self.colors.tolist(), self.feathers)
+        )
+
+    def scaled(self, start_scale=1.0, speed_scale=1.0):
+        """
+        Copy with start frames and speeds multiplied, e.g. for percent timing or previews.
+
+        Feather widths are in pixels like speeds, so they follow speed_scale.
+        """
+        return DilationSchedule(self.starts * start_scale, self.speeds * speed_scale, self.colors, self.feathers * speed_scale)
+
+    def with_default_feather(self, feather):
+        """Copy in which layers without a feather width get feather."""
+        return DilationSchedule(self.starts, self.speeds, self.colors, np.where(self.feathers > 0, self.feathers, feather))
+
+    def layers(self):
+        """(start_frame, speed, (r, g, b), feather) tuples in drawing order."""
+        return [
+            (start, speed, tuple(color), feather)
+            for start, speed, color, feather in zip(self.starts.tolist(), self.speeds.tolist(), self.colors.tolist(), self.feathers.tolist())
+        ]
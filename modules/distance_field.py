@@ -0,0 +1,148 @@
+import numpy as np
+import torch
+from .dilation import MaskDistanceFields, PackedMasks, distance_transform
+from .frame_dedup import dedup_ratio, first_occurrences, packed_digest
+from .parallel import frame_chunks, map_frames
+
+# Reusable distance fields passed between nodes as DISTANCE_FIELD.
+#
+# When one mask feeds several dilation nodes, each of them would compute the
+# same distance transforms. A DistanceField computes them once per distinct
+# mask frame and keeps them in compact 16-bit chunks, together with the packed
+# masks, so any dilation node can take it in place of the MASK.
+
+FIELD_PRECISIONS = ["uint16", "float16"]
+
+# uint16 code for pixels with no mask pixel in their frame
+UINT16_INFINITY = np.iinfo(np.uint16).max
+
+def max_frame_distance(height, width, shape="circle"):
+    """Largest finite distance to a mask pixel a height x width frame can hold."""
+    if shape == "circle":
+        return float(np.hypot(height - 1, width - 1))
+    return float(max(height, width) - 1)
+
+def uint16_scale(max_distance):
+    """Power-of-two steps per pixel that fit max_distance below UINT16_INFINITY (integer distances stay exact)."""
+    return float(2.0 ** np.floor(np.log2((UINT16_INFINITY - 1) / max(max_distance, 1.0))))
+
+def resolve_mask(mask, distance_field):
+    """The MASK a node works on: its mask input, or the masks of a connected distance field."""
+    if distance_field is not None:
+        return distance_field.to_mask()
+    if mask is None:
+        raise ValueError("Connect either a mask or a distance_field.")
+    return mask
+
+def resolve_mask_fields(mask, distance_field, shape="circle", factor=1):
+    """
+    (masks, fields) for a node that takes a MASK or a DISTANCE_FIELD.
+
+    masks are the full-resolution PackedMasks, fields the MaskDistanceFields at
+    the preview factor. A connected distance field wins and brings its shape.
+    """
+    if distance_field is not None:
+        return distance_field.masks, distance_field.mask_fields(factor)
+    mask = resolve_mask(mask, distance_field)
+    masks = PackedMasks.from_mask(mask)
+    return masks, MaskDistanceFields(masks if factor == 1 else PackedMasks.from_mask(mask, factor), shape)
+
+class DistanceField:
+    """
+    Distance fields of a mask batch, one per distinct frame, stored in 16-bit chunks.
+
+    "uint16" stores distances in fixed point with scale steps per pixel (1/16 px
+    for 1080p frames), "float16" keeps them as half floats, exact up to 2048 px
+    for chessboard distances and within 1/2048 of the distance otherwise.
+    Fields are decoded to float32 one frame at a time when read.
+
+    Args:
+    - masks (PackedMasks): The binary masks the fields belong to.
+    - shape (str): "circle" or "square".
+    - precision (str): "uint16" or "float16".
+    - chunks (list of np.ndarray): Encoded fields, chunk_size distinct frames per chunk.
+    - sources (list of int): First identical frame for every frame.
+    - scale (float): Steps per pixel of the "uint16" encoding.
+    - chunk_size (int): Distinct frames per chunk.
+    """
+    def __init__(self, masks, shape, precision, chunks, sources, scale=1.0, chunk_size=16):
+        self.masks = masks
+        self.shape = shape
+        self.precision = precision
+        self.chunks = chunks
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self._sources = sources
+        self._slots = {source: slot for slot, source in enumerate(sorted(set(sources)))}
+
+    @classmethod
+    def compute(cls, mask, shape="circle", precision="uint16", workers=1, chunk_size=16):
+        """Distance fields of every distinct frame of a MASK batch, computed chunk by chunk on a thread pool."""
+        if precision not in FIELD_PRECISIONS:
+            raise ValueError(f"Unsupported field precision '{precision}', expected one of {FIELD_PRECISIONS}.")
+        masks = PackedMasks.from_mask(mask, chunk_size=chunk_size)
+        sources = first_occurrences(packed_digest(packed) for packed in masks.packed)
+        unique = sorted(set(sources))
+        scale = uint16_scale(max_frame_distance(*masks.shape[1:3], shape))
+
+        def encode(source):
+            field = distance_transform(masks[source], shape)
+            if precision == "float16":
+                return field.astype(np.float16)
+            encoded = np.minimum(np.rint(field * scale), UINT16_INFINITY - 1)
+            encoded[~np.isfinite(field)] = UINT16_INFINITY
+            return encoded.astype(np.uint16)
+
+        chunks = [
+            np.stack(map_frames(encode, unique[start:end], workers))
+            for start, end in frame_chunks(len(unique), chunk_size)
+        ]
+        return cls(masks, shape, precision, chunks, sources, scale, chunk_size)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def source_index(self, index):
+        return self._sources[min(index, len(self) - 1)]
+
+    @property
+    def max_error(self):
+        """Largest difference in pixels between a stored and an exact distance."""
+        if self.precision == "float16":
+            # Half the float16 spacing at the largest distance
+            return float(np.spacing(np.float16(max_frame_distance(*self.masks.shape[1:3], self.shape)))) / 2
+        return 0.5 / self.scale
+
+    @property
+    def nbytes(self):
+        """Bytes held by the encoded fields and the packed masks."""
+        return sum(chunk.nbytes for chunk in self.chunks) + self.masks.packed.nbytes
+
+    def dedup_ratio(self):
+        """Mask frames per stored field."""
+        return dedup_ratio(len(self), len(self._slots))
+
+    def field(self, index):
+        """float32 distance field of the frame at index (inf where the frame is empty)."""
+        slot = self._slots[self.source_index(index)]
+        encoded = self.chunks[slot // self.chunk_size][slot % self.chunk_size]
+        if self.precision == "float16":
+            return encoded.astype(np.float32)
+        field = encoded.astype(np.float32) / np.float32(self.scale)
+        field[encoded == UINT16_INFINITY] = np.inf
+        return field
+
+    def to_mask(self):
+        """The binary masks as a float32 MASK tensor."""
+        return torch.from_numpy(self.masks[:].astype(np.float32))
+
+    def mask_fields(self, factor=1):
+        """
+        MaskDistanceFields for the dilation engine.
+
+        At full resolution they read the stored fields; a preview factor needs
+        fields of the downscaled masks, which are computed as usual.
+        """
+        if factor == 1:
+            return MaskDistanceFields(self.masks, self.shape, store=self)
+        return MaskDistanceFields(self.masks.downscaled(factor), self.shape)
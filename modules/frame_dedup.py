@@ -0,0 +1,31 @@
+import hashlib
+import numpy as np
+
+# Content-hash deduplication of binary mask frames.
+#
+# Segmentation masks often hold the same frame for long stretches (locked-off
+# shots, held poses), not always back to back. Each frame is reduced to a short
+# digest of its packed bits, so identical frames anywhere in the batch can share
+# the expensive per-frame work.
+
+DIGEST_SIZE = 16
+
+def packed_digest(packed_frame):
+    """Digest of an already bit-packed mask frame."""
+    return hashlib.blake2b(np.ascontiguousarray(packed_frame).tobytes(), digest_size=DIGEST_SIZE).digest()
+
+def first_occurrences(digests):
+    """Index of the first equal digest for every digest."""
+    first_seen = {}
+    return [first_seen.setdefault(digest, index) for index, digest in enumerate(digests)]
+
+def group_frames(sources):
+    """Lists of frame indices sharing a source, in order of first appearance."""
+    groups = {}
+    for index, source in enumerate(sources):
+        groups.setdefault(source, []).append(index)
+    return list(groups.values())
+
+def dedup_ratio(requested, unique):
+    """Requested work items per item actually computed (1.0 when nothing was shared)."""
+    return requested / unique if unique else 1.0
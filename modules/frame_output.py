@@ -0,0 +1,72 @@
+import os
+import tempfile
+import weakref
+import numpy as np
+import torch
+
+# Output buffers for frame-producing nodes.
+#
+# Long renders can produce IMAGE batches far larger than RAM. In "memmap" mode
+# frames are written into a disk-backed np.memmap in a scratch directory and the
+# returned tensor shares that buffer, so only the pages being touched need RAM.
+
+OUTPUT_MODES = ["memory", "memmap", "auto"]
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def memmap_frames(shape, scratch_dir="", dtype=np.float32):
+    """
+    Disk-backed array in scratch_dir that deletes its file once no longer used.
+
+    The file is unlinked right away where the OS allows it (the mapping stays
+    valid), otherwise it is removed when the array is garbage collected.
+    """
+    scratch_dir = scratch_dir.strip() or None
+    if scratch_dir is not None:
+        os.makedirs(scratch_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="ak_frames_", suffix=".bin", dir=scratch_dir)
+    os.close(fd)
+    buffer = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    try:
+        os.remove(path)
+    except OSError:
+        weakref.finalize(buffer, _remove_file, path)
+    return buffer
+
+def allocate_frames(shape, output_mode="memory", scratch_dir="", ram_limit_mb=0):
+    """
+    Preallocated float32 tensor for a node's frame output.
+
+    "memory" keeps it in RAM, "memmap" always puts it on disk, and "auto" puts it
+    on disk only when it would exceed ram_limit_mb.
+    """
+    if not keeps_in_ram(shape, output_mode, ram_limit_mb):
+        return torch.from_numpy(memmap_frames(shape, scratch_dir))
+    return torch.empty(shape, dtype=torch.float32)
+
+def frames_mb(shape):
+    return np.prod(shape, dtype=np.int64) * np.dtype(np.float32).itemsize / (1024 * 1024)
+
+def keeps_in_ram(shape, output_mode="memory", ram_limit_mb=0):
+    """Whether allocate_frames keeps a float32 output of this shape in RAM."""
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unsupported output mode '{output_mode}', expected one of {OUTPUT_MODES}.")
+    return output_mode == "memory" or (output_mode == "auto" and frames_mb(shape) <= ram_limit_mb)
+
+def cache_limit(shape, output_mode="memory", ram_limit_mb=0, sink=False, resident_bytes=0):
+    """
+    Bytes of intermediate data (distance fields) a render may keep resident.
+
+    None (no limit) when everything stays in RAM anyway; otherwise whatever is
+    left of ram_limit_mb once an output kept in RAM and resident_bytes of other
+    inputs held for the whole render (e.g. a DistanceField) are counted against it.
+    """
+    in_ram = keeps_in_ram(shape, output_mode, ram_limit_mb)
+    if in_ram and not sink:
+        return None
+    used_mb = (frames_mb(shape) if in_ram else 0) + resident_bytes / (1024 * 1024)
+    return int(max(ram_limit_mb - used_mb, 0) * 1024 * 1024)
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import numpy as np
+import cv2
+
+# Streaming frame sinks for long renders.
+#
+# Instead of building a whole-batch IMAGE tensor, frame-producing nodes can push
+# frames chunk by chunk into a sink that encodes them straight to local disk, as
+# a video through cv2.VideoWriter or as a PNG/NPY sequence. Only the chunk being
+# written has to be in memory.
+
+SINK_FORMATS = ["none", "mp4", "png", "npy"]
+
+def resolve_sink_path(path, sink_format, prefix="ak_frames"):
+    """
+    Output location for a sink.
+
+    A path ending in .mp4 (for "mp4") is used as the video file. Any other path,
+    or the system temp directory when empty, is a directory in which a new
+    uniquely named video file or sequence directory is created.
+    """
+    path = path.strip()
+    if sink_format == "mp4" and path.lower().endswith(".mp4"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return path
+    directory = path or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    if sink_format == "mp4":
+        fd, video_path = tempfile.mkstemp(prefix=f"{prefix}_", suffix=".mp4", dir=directory)
+        os.close(fd)
+        return video_path
+    return tempfile.mkdtemp(prefix=f"{prefix}_", dir=directory)
+
+def to_uint8_frames(frames):
+    """[N, H, W, C] (or [N, H, W]) frames in 0..1 as uint8, passing uint8 frames through."""
+    frames = np.asarray(frames)
+    if frames.dtype == np.uint8:
+        return frames
+    return (np.clip(frames, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+class FrameSink:
+    """
+    Writes RGB (or single-channel) frames to disk as they are produced.
+
+    Args:
+    - path (str): File or directory, see resolve_sink_path.
+    - sink_format (str): "mp4", "png" or "npy".
+    - fps (float): Frame rate of the video.
+    - prefix (str): Name prefix of generated files and directories.
+    """
+    def __init__(self, path="", sink_format="mp4", fps=30, prefix="ak_frames"):
+        if sink_format not in SINK_FORMATS or sink_format == "none":
+            raise ValueError(f"Unsupported sink format '{sink_format}', expected one of {SINK_FORMATS[1:]}.")
+        self.sink_format = sink_format
+        self.fps = fps
+        self.path = resolve_sink_path(path, sink_format, prefix)
+        self.frame_count = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, frames):
+        """Append a chunk of [N, H, W, 3] RGB or [N, H, W] frames (float 0..1 or uint8)."""
+        for frame in to_uint8_frames(frames):
+            if self.sink_format == "npy":
+                # NPY frames keep the RGB channel order of the IMAGE tensor
+                np.save(os.path.join(self.path, f"frame_{self.frame_count:06d}.npy"), frame)
+            else:
+                if frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                if self.sink_format == "mp4":
+                    self._write_video_frame(frame)
+                else:
+                    cv2.imwrite(os.path.join(self.path, f"frame_{self.frame_count:06d}.png"), frame)
+            self.frame_count += 1
+
+    def _write_video_frame(self, frame):
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self._writer = cv2.VideoWriter(self.path, fourcc, float(self.fps), (width, height), frame.ndim == 3)
+            if not self._writer.isOpened():
+                raise RuntimeError(f"Could not open a video writer for '{self.path}'.")
+        self._writer.write(frame)
+
+    def close(self):
+        """Finish the video file; returns (path, frame_count)."""
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        return self.path, self.frame_count
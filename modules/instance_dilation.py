@@ -0,0 +1,205 @@
+import numpy as np
+import cv2
+import torch
+from .dilation import FieldCache, PackedMasks, distance_transform, downscale_masks, feather_alpha, label_dtype
+from .frame_dedup import first_occurrences, packed_digest
+from .parallel import map_frames
+
+# Multi-instance dilation: every instance of a labeled mask grows with its own
+# speed and color, all in one pass.
+#
+# A single labeled distance transform gives each pixel its distance to the
+# nearest instance and which instance that is (a Voronoi partition of the frame),
+# so instances never overlap and a pixel only has to wait for its own instance.
+
+INSTANCE_MODES = ["connected_components", "mask_values"]
+
+def instance_values(mask):
+    """Sorted distinct non-zero values of a MASK batch, one instance per value."""
+    values = set()
+    for frame in mask:
+        frame = frame.cpu().numpy() if isinstance(frame, torch.Tensor) else np.asarray(frame)
+        values.update(np.unique(frame[frame > 0]).tolist())
+    return np.array(sorted(values), dtype=np.float32)
+
+def instance_labels(mask_frame, mode, values=None):
+    """
+    Instance id per pixel of a mask frame, 0 for the background.
+
+    "connected_components" numbers the 8-connected blobs of the frame in scan
+    order, "mask_values" numbers pixels by their position in values (1-based).
+    """
+    if mode == "connected_components":
+        _, labels = cv2.connectedComponents((mask_frame > 0).astype(np.uint8), connectivity=8)
+        return labels
+    labels = np.searchsorted(values, mask_frame).astype(np.int32) + 1
+    labels[mask_frame <= 0] = 0
+    return labels
+
+def instance_distance_transform(labels, shape="circle"):
+    """
+    Distance to the nearest instance and that instance's id for every pixel.
+
+    The distance is exact (as in distance_transform). The owner comes from
+    OpenCV's labeled distance transform, which uses a 5x5 mask for circles, so
+    pixels on a Voronoi boundary may go to a neighbour less than a pixel further.
+    """
+    field = distance_transform(labels > 0, shape)
+    if not np.isfinite(field).any():
+        return field, np.zeros(labels.shape, dtype=np.int32)
+    background = (labels == 0).astype(np.uint8)
+    if shape == "circle":
+        _, nearest = cv2.distanceTransformWithLabels(background, cv2.DIST_L2, 5, labelType=cv2.DIST_LABEL_PIXEL)
+    else:
+        _, nearest = cv2.distanceTransformWithLabels(background, cv2.DIST_C, 3, labelType=cv2.DIST_LABEL_PIXEL)
+    # Mask pixels are numbered from 1 in scan order
+    owners = np.zeros(np.count_nonzero(labels) + 1, dtype=np.int32)
+    owners[1:] = labels[labels > 0]
+    return field, owners[nearest]
+
+class InstanceFields:
+    """
+    Lazily computes the instance distance field and owner map per distinct frame.
+
+    Identical frames (same instance ids everywhere) share one field. masks holds
+    the packed union of all instances, which composite_layers reads for the
+    frame size. As in MaskDistanceFields, cache_limit bounds the bytes of fields
+    kept between uses.
+
+    With factor > 1 the fields are computed for previews at 1/factor resolution:
+    instances are numbered at full resolution and each block takes the largest
+    id among its pixels, so a block is set exactly when it is in the downscaled
+    union (as in downscale_masks) and ids match the full-resolution render.
+    """
+    def __init__(self, mask, mode="connected_components", shape="circle", factor=1):
+        self.mask = mask
+        self.mode = mode
+        self.shape = shape
+        self.factor = factor
+        self.values = instance_values(mask) if mode == "mask_values" else None
+        self.masks = PackedMasks.from_mask(mask, factor)
+        self._sources = first_occurrences(packed_digest(self._frame(index)) for index in range(len(self.masks)))
+        self._fields = FieldCache()
+
+    def __len__(self):
+        return len(self.masks)
+
+    def _frame(self, index):
+        frame = self.mask[index]
+        return frame.cpu().numpy() if isinstance(frame, torch.Tensor) else np.asarray(frame)
+
+    def source_index(self, index):
+        return self._sources[min(index, len(self) - 1)]
+
+    def labels(self, index):
+        labels = instance_labels(self._frame(self.source_index(index)), self.mode, self.values)
+        return downscale_masks(labels[None], self.factor)[0]
+
+    @property
+    def cache_limit(self):
+        """Largest number of bytes of fields kept between uses, None for no limit."""
+        return self._fields.limit
+
+    @cache_limit.setter
+    def cache_limit(self, limit):
+        self._fields.limit = limit
+
+    def field(self, index):
+        """(distance, owner) pair for the frame at index."""
+        source = self.source_index(index)
+        field = self._fields.get(source)
+        if field is None:
+            field = instance_distance_transform(self.labels(source), self.shape)
+            self._fields.put(source, field)
+        return field
+
+    def compute_fields(self, indices, workers=1):
+        """Compute the fields of the given frames up front, in parallel (only the last ones stay with a cache_limit)."""
+        missing = sorted({self.source_index(index) for index in indices} - set(self._fields.keys()))
+        map_frames(lambda source: self.field(source) is None, missing, workers)
+
+    def instance_count(self, workers=1):
+        """Largest instance id over the batch (computes every field in connected_components mode)."""
+        if self.values is not None:
+            return len(self.values)
+        sources = sorted(set(self._sources))
+        return max(map_frames(lambda source: int(self.field(source)[1].max()), sources, workers), default=0)
+
+    def is_static(self, num_frames=None):
+        """True when every frame up to num_frames shares the first frame's labels."""
+        count = len(self) if num_frames is None else min(num_frames, len(self))
+        # Sources are global first occurrences, so a frame equal to frame 0 may follow different ones
+        return all(source == 0 for source in self._sources[:count])
+
+class InstanceRenderer:
+    """
+    Renders instance i (layers[i - 1]) growing over its own Voronoi cell.
+
+    Drop-in for LayerRenderer in composite_layers: label i is instance i and label
+    0 the background. A static mask gets a single activation-frame map for all
+    instances; moving masks compare each frame's distance with the radius of the
+    pixel's own instance.
+
+    Layers may carry a feather width as a fourth element, in which case the
+    renderer is feathered: colors() fades each instance out over its own width
+    beyond its radius, up to the edge of its Voronoi cell.
+    """
+    def __init__(self, fields, layers, num_frames):
+        self.fields = fields
+        self.layers = layers
+        self.num_frames = num_frames
+        self.static = fields.is_static(num_frames)
+        # Index 0 (background) never turns on
+        self._starts = np.array([np.inf] + [layer[0] for layer in layers], dtype=np.float64)
+        self._speeds = np.array([0.0] + [layer[1] for layer in layers], dtype=np.float64)
+        self._feathers = np.array([0.0] + [layer[3] if len(layer) > 3 else 0.0 for layer in layers], dtype=np.float64)
+        self.feathered = bool((self._feathers > 0).any())
+        self._activation = None
+
+    def activation_map(self):
+        """Frame at which each pixel of a static mask turns on, num_frames if never."""
+        field, owner = self.fields.field(0)
+        starts, speeds = self._starts[owner], self._speeds[owner]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frames = np.where(speeds > 0, np.ceil(starts - 1 + field / speeds), np.where(field <= 0, starts, np.inf))
+        frames = np.minimum(np.maximum(frames, np.ceil(starts)), self.num_frames)
+        return frames.astype(np.uint16 if self.num_frames < np.iinfo(np.uint16).max else np.int32)
+
+    def prepare(self, workers=1):
+        """Compute the fields (and the activation map of a static mask) up front."""
+        if self.static:
+            if self.feathered:
+                # colors() blends straight from the field
+                self.fields.field(0)
+            elif self._activation is None:
+                self._activation = self.activation_map()
+        elif self.fields.cache_limit is None:
+            self.fields.compute_fields(range(self.num_frames), workers)
+
+    def radii(self, index):
+        """Radius of every instance at a frame (index 0 is the background), -inf before it starts."""
+        with np.errstate(invalid="ignore"):
+            return np.where(index >= self._starts, self._speeds * (index - self._starts + 1), -np.inf)
+
+    def labels(self, index, out=None):
+        """Label map for a frame, optionally written into a preallocated array."""
+        if out is None:
+            out = np.zeros(self.fields.masks.shape[1:3], dtype=label_dtype(len(self.layers) + 1))
+        field, owner = self.fields.field(index)
+        if self.static:
+            active = self._activation <= index
+        else:
+            active = field <= self.radii(index)[owner]
+        np.multiply(owner, active, out=out, casting="unsafe")
+        return out
+
+    def colors(self, index, palette, out=None):
+        """Float RGB frame with feathered instance edges, optionally written into a preallocated array."""
+        field, owner = self.fields.field(index)
+        if out is None:
+            out = np.empty(field.shape + (3,), dtype=np.float32)
+        alpha = feather_alpha(field, self.radii(index)[owner], self._feathers[owner])
+        # Instances never overlap, so each one only blends over the background
+        out[:] = palette[0]
+        out += alpha[..., None] * (palette[owner] - palette[0])
+        return out
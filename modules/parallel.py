@@ -0,0 +1,25 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Frame-parallel helpers. The heavy per-frame work (OpenCV morphology and distance
+# transforms, large NumPy comparisons) releases the GIL, so threads scale across
+# cores without copying frames between processes.
+
+def resolve_workers(workers):
+    """Number of worker threads to use, 0 meaning one per CPU core."""
+    if workers and workers > 0:
+        return int(workers)
+    return os.cpu_count() or 1
+
+def map_frames(fn, items, workers=0):
+    """Apply fn to every item on a thread pool and return the results in input order."""
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, items))
+
+def frame_chunks(num_frames, chunk_size):
+    """Contiguous (start, end) frame ranges of at most chunk_size frames."""
+    return [(start, min(start + chunk_size, num_frames)) for start in range(0, num_frames, chunk_size)]
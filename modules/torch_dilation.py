@@ -0,0 +1,229 @@
+import math
+import torch
+import torch.nn.functional as F
+from .frame_dedup import group_frames
+
+# Batched mask dilation with torch max ops.
+#
+# A square of radius a is a separable pair of 1D max filters. A disc of radius r
+# is approximated by a regular octagon, the Minkowski sum of a square of radius a
+# and a diamond of radius b = (2 - sqrt(2)) * (a + b). Its edges lie at a + b from
+# the centre and its vertices 1 / cos(pi / 8) (about 1.082) times further out, so
+# a + b is chosen between the inscribed and circumscribed octagons: edges and
+# vertices then miss the circle by the same OCTAGON_ERROR * r (about 4%). The
+# diamond is a pair of 1D max filters along the diagonals plus one or two 3x3
+# crosses. Every 1D filter doubles its window with shifted maxima, so its cost
+# grows with log2 of the radius. Both parts add up exactly, so a mask can be
+# grown from one radius to the next instead of starting over for every frame.
+
+BACKENDS = ["opencv", "torch"]
+
+# Largest number of mask elements fingerprinted at once by mask_sources
+FINGERPRINT_CHUNK_ELEMENTS = 1 << 22
+
+# Edge distance of the octagon per pixel of radius, and its largest boundary error per pixel of radius
+OCTAGON_APOTHEM = 2 * math.cos(math.pi / 8) / (1 + math.cos(math.pi / 8))
+OCTAGON_ERROR = 2 / (1 + math.cos(math.pi / 8)) - 1
+
+def octagon_steps(shape, radius):
+    """(square_radius, diamond_radius) pair approximating a dilation by radius."""
+    radius = max(int(radius), 0)
+    if shape == "square":
+        return radius, 0
+    apothem = int(round(radius * OCTAGON_APOTHEM))
+    diamond = int(round(apothem * (2 - math.sqrt(2))))
+    return apothem - diamond, diamond
+
+def shape_error(shape, radius):
+    """
+    Largest boundary shift in pixels between dilate_batch and an exact dilation by radius.
+
+    Squares are exact. Circles are off by OCTAGON_ERROR * radius, plus up to a
+    pixel from rounding the octagon to whole square and diamond radii.
+    """
+    if shape == "square" or radius <= 0:
+        return 0.0
+    return OCTAGON_ERROR * radius + 1
+
+def line_max(x, radius, dy, dx):
+    """
+    Max over the 2 * radius + 1 pixels centred on each pixel along the step (dy, dx) of a [..., H, W] batch.
+
+    dy and dx are 0 or 1 and pixels outside the frame count as 0. The window
+    is doubled with shifted maxima, so the filter takes about log2(2 * radius + 1) passes.
+    """
+    if radius <= 0:
+        return x
+    x = F.pad(x, (radius * dx, radius * dx, radius * dy, radius * dy))
+
+    def shifted_max(x, offset):
+        height, width = x.shape[-2] - offset * dy, x.shape[-1] - offset * dx
+        return torch.maximum(x[..., :height, :width], x[..., offset * dy:offset * dy + height, offset * dx:offset * dx + width])
+
+    size, window = 2 * radius + 1, 1
+    while 2 * window <= size:
+        x = shifted_max(x, window)
+        window *= 2
+    if size > window:
+        x = shifted_max(x, size - window)
+    return x
+
+def cross_max(x):
+    """Dilate a [..., H, W] batch by the 3x3 cross."""
+    return torch.maximum(line_max(x, 1, 0, 1), line_max(x, 1, 1, 0))
+
+def dilate_steps(x, square_radius, diamond_radius):
+    """
+    Dilate a [B, 1, H, W] binary batch by a square and then a diamond.
+
+    The diagonal filters of radius k reach the diamond's points of even
+    coordinate sum up to 2k, one cross adds the odd ones up to 2k + 1, so an odd
+    radius takes one cross and an even radius two. Their paths can leave the
+    frame, so the diamond is grown on a copy padded by its radius.
+    """
+    x = line_max(line_max(x, square_radius, 0, 1), square_radius, 1, 0)
+    if diamond_radius > 0:
+        height, width = x.shape[-2:]
+        half = (diamond_radius - 1) // 2
+        x = line_max(F.pad(x, (diamond_radius,) * 4), half, 1, 1)
+        x = line_max(x.flip(-1), half, 1, 1).flip(-1)
+        for _ in range(diamond_radius - 2 * half):
+            x = cross_max(x)
+        x = x[..., diamond_radius:diamond_radius + height, diamond_radius:diamond_radius + width]
+    return x
+
+def mask_sources(masks):
+    """
+    Index of the first identical frame for every frame of a [B, H, W] mask batch, matched on its device.
+
+    Frames are fingerprinted by a random integer weighting of their set pixels.
+    Only the fingerprints leave the device, and frames with equal fingerprints
+    are compared in full before they are matched.
+    """
+    flat = masks.flatten(1)
+    generator = torch.Generator().manual_seed(0)
+    weights = torch.randint(0, 1 << 40, (flat.shape[1],), generator=generator, dtype=torch.int64).to(flat.device)
+    chunk_size = max(FINGERPRINT_CHUNK_ELEMENTS // max(flat.shape[1], 1), 1)
+    fingerprints = torch.cat([
+        torch.where(flat[start:start + chunk_size] > 0, weights, 0).sum(1)
+        for start in range(0, len(flat), chunk_size)
+    ]).tolist() if len(flat) else []
+
+    candidates = {}
+    sources = []
+    for index, fingerprint in enumerate(fingerprints):
+        matches = candidates.setdefault(fingerprint, [])
+        source = next((source for source in matches if torch.equal(flat[source] > 0, flat[index] > 0)), None)
+        if source is None:
+            matches.append(index)
+            source = index
+        sources.append(source)
+    return sources
+
+def first_covered_frame(dilated, indices, radii, sources, shape="circle"):
+    """
+    First of the given frame indices whose dilation covers the whole frame, -1 if none does.
+
+    Coverage only depends on a frame's mask and grows with its radius, so every
+    distinct mask is binary searched over its own radii, and masks that only
+    appear after a covered frame are skipped. Each probe checks one dilated
+    frame instead of scanning the whole batch.
+
+    Args:
+    - dilated (torch.Tensor): Dilated batch of shape [B, H, W], in the order of indices.
+    - indices (list of int): Frame index of every dilated frame.
+    - radii (list of float): Radius of every dilated frame.
+    - sources (list of int): First identical mask frame for every dilated frame, as from mask_sources.
+    - shape (str): "circle" or "square".
+    """
+    steps = [octagon_steps(shape, radius) for radius in radii]
+    groups = sorted((sorted(group, key=lambda position: indices[position]) for group in group_frames(sources)),
+                    key=lambda group: indices[group[0]])
+    best = -1
+    for group in groups:
+        if best != -1 and indices[group[0]] >= best:
+            break
+        # Steps grow with the radius in both parts, so coverage is monotonic in them
+        candidates = sorted({steps[position] for position in group})
+        probes = {steps[position]: position for position in group}
+        low, high = 0, len(candidates)
+        while low < high:
+            middle = (low + high) // 2
+            if bool(dilated[probes[candidates[middle]]].all()):
+                high = middle
+            else:
+                low = middle + 1
+        if low < len(candidates):
+            index = min(indices[position] for position in group if steps[position] >= candidates[low])
+            best = index if best == -1 else min(best, index)
+    return best
+
+def mask_groups(binary):
+    """Split a [B, H, W] binary batch into groups of identical frames."""
+    return group_frames(mask_sources(binary))
+
+def dilate_batch(masks, radii, shape="circle"):
+    """
+    Dilate a [B, H, W] mask batch by a per-frame radius in one pass.
+
+    Identical mask frames anywhere in the batch are matched on the device and
+    share one working copy that is grown incrementally: each step only dilates
+    by the difference to the next radius, so a static mask costs the per-frame
+    step rather than the accumulated radius. Every distinct mask starts from
+    itself. Only the union bounding box of the batch grown by the
+    largest radius is pooled, since nothing outside it can be reached. The batch
+    stays on the device it arrives on and comes back as a binary float32 tensor.
+
+    Args:
+    - masks (torch.Tensor): Mask batch of shape [B, H, W].
+    - radii (sequence or torch.Tensor): One radius per frame, fractional radii are floored.
+    - shape (str): "circle" or "square".
+
+    Returns:
+    - torch.Tensor: The dilated binary mask batch.
+    """
+    radii = torch.as_tensor(radii, dtype=torch.float64).flatten().tolist()
+    if len(radii) != masks.shape[0]:
+        raise ValueError(f"Expected {masks.shape[0]} radii, got {len(radii)}.")
+
+    steps = [octagon_steps(shape, radius) for radius in radii]
+    result = (masks > 0).to(torch.float32)
+    if not steps:
+        return result
+
+    occupied = result.amax(0)
+    rows = torch.nonzero(occupied.amax(1)).flatten().tolist()
+    if not rows:
+        return result
+    cols = torch.nonzero(occupied.amax(0)).flatten().tolist()
+    reach = max(square + diamond for square, diamond in steps)
+    top, left = max(rows[0] - reach, 0), max(cols[0] - reach, 0)
+    dilate_region(result[:, top:rows[-1] + reach + 1, left:cols[-1] + reach + 1], steps)
+    return result
+
+def dilate_region(result, steps):
+    """Dilate a [B, H, W] binary float32 batch in place by per-frame (square, diamond) steps."""
+    # One working row per distinct mask, ordered so that finished groups drop off the front
+    groups = sorted(mask_groups(result), key=lambda group: max(steps[index] for index in group))
+    targets = {}
+    for row, group in enumerate(groups):
+        for index in group:
+            targets.setdefault(steps[index], []).append((row, index))
+    last_step = [max(steps[index] for index in group) for group in groups]
+    # uint8 working copies move a quarter of the float32 data through every max
+    working = result[torch.tensor([group[0] for group in groups], dtype=torch.long, device=result.device)].unsqueeze(1).to(torch.uint8)
+
+    current = (0, 0)
+    dropped = 0
+    for target in sorted(targets):
+        working = dilate_steps(working, target[0] - current[0], target[1] - current[1])
+        rows, indices = zip(*targets[target])
+        rows = torch.tensor(rows, dtype=torch.long, device=result.device) - dropped
+        result[torch.tensor(indices, dtype=torch.long, device=result.device)] = working[rows, 0].to(result.dtype)
+
+        finished = 0
+        while dropped + finished < len(groups) and last_step[dropped + finished] == target:
+            finished += 1
+        working = working[finished:]
+        dropped += finished
+        current = target
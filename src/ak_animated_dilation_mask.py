@@ -1,7 +1,6 @@
-import numpy as np
-import copy
-import cv2
-import torch
+from ..modules.dilation import PREVIEW_SCALES, dilate_mask_frames, cache_info, cache_report, preview_error
+from ..modules.distance_field import resolve_mask
+from ..modules.torch_dilation import BACKENDS
 
 class AK_AnimatedDilationMaskLinear:
     def __init__(self):
@@ -11,7 +10,6 @@ class AK_AnimatedDilationMaskLinear:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "mask": ("MASK",),
                 "shape": (["circle", "square"],),
                 "dilate_per_frame": ("INT", {
                     "default": 1,
@@ -25,56 +23,55 @@ class AK_AnimatedDilationMaskLinear:
                     "max": 99999999,
                     "step": 1,
                 }),
+                "backend": (BACKENDS,),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+                "feather": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 1024.0,
+                    "step": 0.5,
+                    "display": "number",
+                }),
+            },
+            "optional": {
+                "mask": ("MASK",),
+                "distance_field": ("DISTANCE_FIELD",),
             },
         }
 
     CATEGORY = "💜Akatz Nodes/Mask"
-    RETURN_TYPES = ("MASK",)
+    RETURN_TYPES = ("MASK", "FLOAT", "INT", "FLOAT", "STRING")
+    RETURN_NAMES = ("mask", "max_error_px", "coverage_frame", "dedup_ratio", "cache_reuse")
     FUNCTION = "dilate_mask_linear"
     DESCRIPTION = """
     # Animated Dilate Mask Linear
-    - mask: Input mask or mask batch
+    - mask (optional): Input mask or mask batch
+    - distance_field (optional): Precomputed DISTANCE_FIELD used in place of mask, its shape replaces shape
     - shape: "circle" or "square", "circle" is most accurate to mask shape, "square" is fast to compute for testing purposes
     - step: how much should the mask be dilated per frame
     - delay: delay in frames before starting dilation
+    - backend: "opencv" dilates each frame exactly, "torch" dilates the whole batch on the mask's device (circles approximated by octagons, within about 4% of the radius plus a pixel)
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - feather: Width in pixels over which the dilated edge fades out, 0 keeps hard edges (read off the same distance field, so no blur pass is needed; always uses the opencv path)
+    - coverage_frame (output): First frame the dilated mask fills completely, -1 if it never does
+    - dedup_ratio (output): Dilations requested per distinct (mask frame, radius) pair, identical frames are dilated once
+    - cache_reuse (output): Dilations of this run read off an already computed distance field vs distance transforms computed, and structuring elements reused vs built (the torch backend uses neither)
     """
     
-    def dilate_mask_linear(self, mask, shape, dilate_per_frame, delay):
-        
-        dup = copy.deepcopy(mask.cpu().numpy())
-        rads = []
-        radius = 0
-
-        for index, frame_mask in enumerate(dup):
-
-            if index < delay:
-                dup[index] = frame_mask
-                continue
-
-            radius += dilate_per_frame
-
-            rads.append(radius)
-
-            if index > 0 and np.all(dup[index - 1] == 1):
-                s = abs(int(1000))
-                d = s * 2 + 1
-                k = np.zeros((d, d), np.uint8)
-                k += 1
-                dup[index] = cv2.dilate(frame_mask, k, iterations=1)
-                continue
-        
-            s = abs(int(radius))
-            d = s * 2 + 1
-            k = np.zeros((d, d), np.uint8)
-            if shape == "circle":
-                k = cv2.circle(k, (s,s), s, 1, -1)
-            else:
-                k += 1
-            
-            if radius > 0:
-                dup[index] = cv2.dilate(frame_mask, k, iterations=1)
-            else:
-                dup[index] = cv2.erode(frame_mask, k, iterations=1)
-        
-        result = torch.from_numpy(dup)
-        return (result,)
\ No newline at end of file
+    def dilate_mask_linear(self, mask=None, shape="circle", dilate_per_frame=1, delay=0, backend="opencv", workers=0, preview_scale="1", feather=0.0, distance_field=None):
+        mask = resolve_mask(mask, distance_field)
+        factor = PREVIEW_SCALES[preview_scale]
+        indices = range(delay, mask.shape[0])
+        radii = [dilate_per_frame * (index - delay + 1) for index in indices]
+        caches_before = cache_info()
+        result, coverage_frame, ratio = dilate_mask_frames(mask, indices, radii, shape, backend, workers, factor, feather, distance_field)
+        max_error = preview_error(factor, backend, shape if distance_field is None else distance_field.shape, max(radii, default=0))
+        return (result, max_error, coverage_frame, ratio, cache_report(caches_before))
\ No newline at end of file
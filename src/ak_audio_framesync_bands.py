@@ -0,0 +1,69 @@
+import re
+from ..modules.audio import band_dbfs, dbfs_range, dbfs_to_loudness, frame_range, interpolate_easing, open_audio
+from ..modules.easing import easing_functions
+
+# Number of band outputs, unused ones return empty lists
+MAX_BANDS = 8
+
+class AK_AudioFramesyncBands:
+    @classmethod
+    def INPUT_TYPES(cls):
+        easing_fns = list(easing_functions.keys())
+        easing_fns.insert(0, "None")
+        return {
+            "required": {
+                "band_edges": ("STRING", {"default": "20, 250, 4000, 16000"}),
+                "amp_control": ("FLOAT", {"min": 0.1, "max": 1024.0, "default": 1.0, "step": 0.01}),
+                "amp_offset": ("FLOAT", {"min": 0.0, "max": 1023.0, "default": 0.0, "step": 0.01}),
+                "frame_rate": ("INT", {"min": 1, "max": 244, "default": 8}),
+                "start_frame": ("INT", {"min": 0, "default": 0}),
+                "end_frame": ("INT", {"min": -1}),
+                "curves_mode": (easing_fns,),
+                "audio_path": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "audio": ("AUDIO",),
+            }
+        }
+
+    RETURN_TYPES = ("LIST",) * MAX_BANDS + ("INT", "INT")
+    RETURN_NAMES = tuple(f"band_{band + 1}" for band in range(MAX_BANDS)) + ("frame_count", "frame_rate")
+
+    FUNCTION = "schedule"
+    CATEGORY = "💜Akatz Nodes/Audio"
+
+    DESCRIPTION = """
+    This node syncs several frequency bands of the audio to frames in one pass, e.g. bass, mids and highs.
+    Every frame gets one windowed FFT, all frames of a block at once, and each band's energy is normalized like Schedule Audio Framesync's loudness.
+    - band_edges: Band edges in Hz, e.g. "20, 250, 4000, 16000" gives band_1 20-250 Hz, band_2 250-4000 Hz and band_3 4000-16000 Hz (up to 8 bands)
+    - amp_control, amp_offset: Scale and offset of every band, as in Schedule Audio Framesync
+    - curves_mode: Easing applied to every band
+    - audio (optional): A ComfyUI AUDIO (waveform and sample rate, read in place) or audio file bytes
+    - audio_path: Local WAV file to stream instead of audio
+    - band_1 ... band_8 (outputs): Loudness per frame of each band, normalized between the band's quietest and loudest frame (empty for unused outputs)
+    """
+
+    def parse_band_edges(self, band_edges):
+        edges = [float(edge) for edge in re.findall(r'\d*\.?\d+', band_edges)]
+        if len(edges) < 2:
+            raise ValueError("band_edges needs at least two frequencies.")
+        if any(high <= low for low, high in zip(edges, edges[1:])):
+            raise ValueError("band_edges must be increasing.")
+        if len(edges) - 1 > MAX_BANDS:
+            raise ValueError(f"band_edges defines {len(edges) - 1} bands, at most {MAX_BANDS} are supported.")
+        return edges
+
+    def schedule(self, band_edges="20, 250, 4000, 16000", amp_control=1.0, amp_offset=0.0, frame_rate=8, start_frame=0, end_frame=0, curves_mode="None", audio_path="", audio=None):
+        edges = self.parse_band_edges(band_edges)
+        read, num_samples, sample_rate, full_scale_amplitude = open_audio(audio, audio_path)
+
+        max_frames, _ = frame_range(num_samples, sample_rate, frame_rate, start_frame, end_frame)
+        bands = []
+        for dbfs in band_dbfs(read, start_frame, start_frame + max_frames, sample_rate, frame_rate, full_scale_amplitude, edges):
+            loudness = dbfs_to_loudness(dbfs, amp_control, amp_offset, *dbfs_range(dbfs))
+            if curves_mode != "None":
+                loudness = interpolate_easing(loudness, easing_functions[curves_mode])
+            bands.append([round(value, 2) for value in loudness.tolist()])
+        bands += [[] for _ in range(MAX_BANDS - len(bands))]
+
+        return (*bands, max_frames, frame_rate)
@@ -1,5 +1,4 @@
-import io
-from pydub import AudioSegment
+from ..modules.audio import dbfs_to_loudness, frame_range, interpolate_easing, loudness_stats, open_audio
 from ..modules.easing import easing_functions
 
 class AK_AudioFramesyncSchedule:
@@ -9,13 +8,16 @@ class AK_AudioFramesyncSchedule:
         easing_fns.insert(0, "None")
         return {
             "required": {
-                "audio": ("AUDIO",),
                 "amp_control": ("FLOAT", {"min": 0.1, "max": 1024.0, "default": 1.0, "step": 0.01}),
                 "amp_offset": ("FLOAT", {"min": 0.0, "max": 1023.0, "default": 0.0, "step": 0.01}),
                 "frame_rate": ("INT", {"min": 1, "max": 244, "default": 8}),
                 "start_frame": ("INT", {"min": 0, "default": 0}),
                 "end_frame": ("INT", {"min": -1}),
-                "curves_mode": (easing_fns,)
+                "curves_mode": (easing_fns,),
+                "audio_path": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "audio": ("AUDIO",),
             }
         }
 
@@ -27,72 +29,24 @@ class AK_AudioFramesyncSchedule:
     
     DESCRIPTION = """
     This node syncs audio to frames by calculating the loudness of the audio at each frame.
+    Frames are cut on exact sample boundaries and the whole track is analysed in a few array operations.
+    - audio (optional): A ComfyUI AUDIO (waveform and sample rate, read in place) or audio file bytes (WAV decoded natively, other formats through pydub)
+    - audio_path: Local WAV file to stream instead of audio; it is memory-mapped and analysed a few seconds at a time, so memory use stays flat for hour-long tracks
     """
 
-    def dbfs_floor_ceiling(self, audio_segment):
-        min_dbfs = 0
-        max_dbfs = -float('inf')
-        for chunk in audio_segment[::1000]:
-            if chunk.dBFS > max_dbfs:
-                max_dbfs = chunk.dBFS
-            if chunk.dBFS < min_dbfs and chunk.dBFS != -float('inf'):
-                min_dbfs = chunk.dBFS
-        return min_dbfs, max_dbfs
-
-    def dbfs2loudness(self, dbfs, amp_control, amp_offset, dbfs_min, dbfs_max):
-        if dbfs == -float('inf'):
-            return amp_offset
-        else:
-            normalized_loudness = (dbfs - dbfs_min) / (dbfs_max - dbfs_min) if dbfs_max - dbfs_min != 0 else dbfs - dbfs_min
-            controlled_loudness = normalized_loudness * amp_control
-            adjusted_loudness = controlled_loudness + amp_offset
-            return max(amp_offset, min(adjusted_loudness, amp_control + amp_offset))
-
-    def interpolate_easing(self, values, easing_function):
-        if len(values) < 3 or easing_function == "None":
-            return values
-        interpolated_values = [values[0]]
-        for i in range(1, len(values) - 1):
-            prev_val, curr_val, next_val = values[i - 1], values[i], values[i + 1]
-            diff_prev = curr_val - prev_val
-            diff_next = next_val - curr_val
-            direction = 1 if diff_next > diff_prev else -1
-            norm_diff = abs(diff_next) / (abs(diff_prev) + abs(diff_next) if abs(diff_prev) + abs(diff_next) != 0 else 1)
-            eased_diff = easing_function(norm_diff) * direction
-            interpolated_value = curr_val + eased_diff * (abs(diff_next) / 2)
-            interpolated_values.append(interpolated_value)
-        interpolated_values.append(values[-1])
-        return interpolated_values
-
-    def schedule(self, audio, amp_control, amp_offset, frame_rate, start_frame, end_frame, curves_mode):
-        audio_segment = AudioSegment.from_file(io.BytesIO(audio), format="wav")
-        
-        frame_duration_ms = int(1000 / frame_rate)
-        start_ms = start_frame * frame_duration_ms
-        total_length_ms = len(audio_segment)
-        total_frames = total_length_ms // frame_duration_ms
-        end_ms = total_length_ms if end_frame <= 0 else min(end_frame * frame_duration_ms, total_length_ms)
+    def schedule(self, audio=None, amp_control=1.0, amp_offset=0.0, frame_rate=8, start_frame=0, end_frame=0, curves_mode="None", audio_path=""):
+        read, num_samples, sample_rate, full_scale_amplitude = open_audio(audio, audio_path)
 
-        audio_segment = audio_segment[start_ms:end_ms]
-        dbfs_min, dbfs_max = self.dbfs_floor_ceiling(audio_segment)
-
-        output = {'average': {'sum': []}}
-
-        max_frames = (end_ms - start_ms) // frame_duration_ms
-        for frame_start_ms in range(0, (max_frames * frame_duration_ms), frame_duration_ms):
-            frame_end_ms = frame_start_ms + frame_duration_ms
-            frame_segment = audio_segment[frame_start_ms:frame_end_ms]
-
-            overall_loudness = self.dbfs2loudness(frame_segment.dBFS, amp_control, amp_offset, dbfs_min, dbfs_max)
-            output['average']['sum'].append(overall_loudness)
+        # Frames are cut on sample boundaries, so they stay in sync at any frame rate
+        max_frames, end_sample = frame_range(num_samples, sample_rate, frame_rate, start_frame, end_frame)
+        dbfs, dbfs_min, dbfs_max = loudness_stats(read, start_frame, start_frame + max_frames, end_sample, sample_rate, frame_rate, full_scale_amplitude)
+        loudness = dbfs_to_loudness(dbfs, amp_control, amp_offset, dbfs_min, dbfs_max)
 
         if curves_mode != "None":
-            output['average']['sum'] = self.interpolate_easing(output['average']['sum'], easing_functions[curves_mode])
-
-        output['average']['sum'] = [round(value, 2) for value in output['average']['sum']]
+            loudness = interpolate_easing(loudness, easing_functions[curves_mode])
 
         return (
-            output['average']['sum'],
+            [round(value, 2) for value in loudness.tolist()],
             max_frames,
             frame_rate
-        )
\ No newline at end of file
+        )
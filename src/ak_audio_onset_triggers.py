@@ -0,0 +1,52 @@
+from ..modules.audio import frame_range, open_audio, pick_onsets, spectral_flux
+
+class AK_AudioOnsetTriggers:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "frame_rate": ("INT", {"min": 1, "max": 244, "default": 8}),
+                "start_frame": ("INT", {"min": 0, "default": 0}),
+                "end_frame": ("INT", {"min": -1}),
+                "delta": ("FLOAT", {"min": 0.0, "max": 1.0, "default": 0.05, "step": 0.01}),
+                "threshold_window": ("FLOAT", {"min": 0.0, "max": 10.0, "default": 0.5, "step": 0.05}),
+                "min_spacing": ("INT", {"min": 1, "default": 2}),
+                "audio_path": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "audio": ("AUDIO",),
+            }
+        }
+
+    RETURN_TYPES = ("LIST", "LIST", "INT", "INT")
+    RETURN_NAMES = ("trigger_frames", "onset_strength", "frame_count", "frame_rate")
+
+    FUNCTION = "detect"
+    CATEGORY = "💜Akatz Nodes/Audio"
+
+    DESCRIPTION = """
+    This node finds the frames at which notes and beats start, for the dilation schedulers' trigger_frames input.
+    Onsets are peaks of the spectral flux (how much the spectrum rises from one frame to the next) above a moving average, so quiet and loud passages trigger alike.
+    - delta: How far above the moving average a peak must be, as a share of the strongest onset
+    - threshold_window: Seconds on either side of a frame averaged for the adaptive threshold
+    - min_spacing: Fewest frames between two triggers, closer peaks keep the strongest
+    - audio (optional): A ComfyUI AUDIO (waveform and sample rate, read in place) or audio file bytes
+    - audio_path: Local WAV file to stream instead of audio
+    - trigger_frames (output): Frame indices of the onsets, counted from start_frame like the frames of Schedule Audio Framesync
+    - onset_strength (output): Spectral flux per frame scaled to 0..1
+    """
+
+    def detect(self, frame_rate=8, start_frame=0, end_frame=0, delta=0.05, threshold_window=0.5, min_spacing=2, audio_path="", audio=None):
+        read, num_samples, sample_rate, full_scale_amplitude = open_audio(audio, audio_path)
+
+        max_frames, _ = frame_range(num_samples, sample_rate, frame_rate, start_frame, end_frame)
+        flux = spectral_flux(read, start_frame, start_frame + max_frames, sample_rate, frame_rate, full_scale_amplitude)
+        onsets = pick_onsets(flux, delta, round(threshold_window * frame_rate), min_spacing)
+        strength = flux / flux.max() if len(flux) and flux.max() > 0 else flux
+
+        return (
+            onsets.tolist(),
+            [round(value, 2) for value in strength.tolist()],
+            max_frames,
+            frame_rate
+        )
@@ -1,11 +1,10 @@
 import numpy as np
-import copy
-import cv2
-import torch
 import re
-import math
-
-PI = math.pi
+from ..modules.dilation import PREVIEW_SCALES, LayerRenderer, composite_layers, preview_error
+from ..modules.dilation_schedule import DilationSchedule
+from ..modules.distance_field import resolve_mask_fields
+from ..modules.frame_output import OUTPUT_MODES, allocate_frames, cache_limit
+from ..modules.frame_sink import SINK_FORMATS, FrameSink
 
 class AK_AudioreactiveDilateMaskInfinite:
     def __init__(self):
@@ -15,8 +14,6 @@ class AK_AudioreactiveDilateMaskInfinite:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "mask": ("MASK",),
-                "normalized_amp": ("*", {"defaultInput": True}),
                 "mask_colors": ("STRING", {
                     "default": '(255, 0, 0), (0, 255, 0), (0, 0, 255)',
                     "multiline": True,
@@ -52,33 +49,91 @@ class AK_AudioreactiveDilateMaskInfinite:
                 "end_frame": ("INT", {
                     "default": 0,
                 }),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "output_mode": (OUTPUT_MODES,),
+                "scratch_dir": ("STRING", {
+                    "default": "",
+                }),
+                "ram_limit_mb": ("INT", {
+                    "default": 4096,
+                    "min": 0,
+                    "step": 256,
+                    "display": "number",
+                }),
+                "sink": (SINK_FORMATS,),
+                "sink_path": ("STRING", {
+                    "default": "",
+                }),
+                "sink_fps": ("INT", {
+                    "default": 30,
+                    "min": 1,
+                    "max": 240,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+                "feather": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 1024.0,
+                    "step": 0.5,
+                    "display": "number",
+                }),
+            },
+            "optional": {
+                "mask": ("MASK",),
+                "distance_field": ("DISTANCE_FIELD",),
+                "normalized_amp": ("*", {"defaultInput": True}),
+                "trigger_frames": ("LIST",),
             },
         }
 
     @classmethod
     def VALIDATE_INPUTS(cls, input_types):
-        if input_types["normalized_amp"] not in ("NORMALIZED_AMPLITUDE", "FLOAT"):
+        if input_types.get("normalized_amp", "FLOAT") not in ("NORMALIZED_AMPLITUDE", "FLOAT"):
             return "normalized_amp must be an NORMALIZED_AMPLITUDE or FLOAT type"
-        if input_types["mask"] != "MASK":
+        if input_types.get("mask", "MASK") != "MASK":
             return "mask must be a MASK type"
         return True
 
     CATEGORY = "💜Akatz Nodes/Mask"
-    RETURN_TYPES = ("IMAGE",)
+    RETURN_TYPES = ("IMAGE", "FLOAT", "INT", "FLOAT", "STRING", "INT")
+    RETURN_NAMES = ("image", "max_error_px", "coverage_frame", "dedup_ratio", "path", "frame_count")
     FUNCTION = "dilate_mask_with_amplitude"
     DESCRIPTION = """
     # Audioreactive Dilate Mask Infinite
-    - mask: Input mask or mask batch
-    - normalized_amp: The normalized amplitude values
+    - mask (optional): Input mask or mask batch
+    - distance_field (optional): Precomputed DISTANCE_FIELD used in place of mask, its shape replaces quality_factor
+    - normalized_amp (optional): The normalized amplitude values
+    - trigger_frames (optional): Frame indices to start a layer at, e.g. from Audio Onset Triggers; used in place of normalized_amp and threshold
     - mask_colors: Colors for the dilation masks in the format "(r, g, b), (r, g, b), ..."
     - threshold: The threshold of the dilation
     - dilation_speed: Speed of dilation in pixels per frame
-    - quality_factor: Quality factor for dilation
+    - quality_factor: 0 dilates with a square, any other value with an exact circle
     - should_composite_subject: Boolean to composite the subject mask over the final result
     - subject_mask_color: Color for the subject mask in the format "R, G, B"
     - initial_background_color: Color for the initial background in the format "R, G, B"
     - start_frame: Start frame for the dilation
     - end_frame: End frame for the dilation (0 for infinite)
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - output_mode: "memory" keeps the output in RAM, "memmap" writes it to a disk-backed buffer, "auto" uses the disk only above ram_limit_mb
+    - scratch_dir: Directory for disk-backed output (empty uses the system temp directory)
+    - ram_limit_mb: Largest output kept in RAM in "auto" mode; with "memmap", "auto" or a sink it also bounds the distance fields kept in RAM (a connected distance_field counts against it), which are then computed as frames are rendered
+    - sink: Stream the frames to disk as they are rendered ("mp4" video, "png" or "npy" sequence) instead of returning the whole batch; image then holds only the last frame
+    - sink_path: Video file (.mp4) or directory for the sink output (empty uses the system temp directory)
+    - sink_fps: Frame rate of the "mp4" sink
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - feather: Width in pixels over which each layer's edge fades out, 0 keeps hard edges (read off the same distance field, so no blur pass is needed)
+    - coverage_frame (output): First frame some layer fills completely, -1 if none does
+    - dedup_ratio (output): Mask frames per distinct mask frame, identical frames share one distance field
+    - path (output): Where the sink wrote the frames (empty without a sink)
+    - frame_count (output): Number of frames rendered
     """
 
     def parse_colors(self, colors_str):
@@ -88,95 +143,46 @@ class AK_AudioreactiveDilateMaskInfinite:
             return [(255, 255, 0), (255, 0, 255)]  # Default to yellow and magenta
         return [(int(r), int(g), int(b)) for r, g, b in matches]
 
-    def dilate_mask(self, mask, dilate_per_frame, start_frame, num_frames, width, height, quality_factor):
-        result_images = np.zeros((num_frames, height, width), dtype=np.uint8)
-        radius = 0
-        
-        shape = "circle"
+    def dilate_mask_with_amplitude(self, mask=None, normalized_amp=None, mask_colors="(255, 0, 0), (0, 255, 0), (0, 0, 255)", threshold=0.5, dilation_speed=30, quality_factor=0.15, should_composite_subject=False, subject_mask_color="255, 0, 0", initial_background_color="0, 0, 0", start_frame=0, end_frame=0, workers=0, output_mode="memory", scratch_dir="", ram_limit_mb=4096, preview_scale="1", feather=0.0, distance_field=None, sink="none", sink_path="", sink_fps=30, trigger_frames=None):
         epsilon = 1e-6
-        if quality_factor < epsilon:
-            shape = "square"
-
-        for index in range(num_frames):
-            if index < start_frame:
-                continue
-
-            frame_index = index
-            frame_mask = mask[frame_index] if frame_index < mask.shape[0] else mask[-1]
-
-            radius += dilate_per_frame
-
-            s = abs(int(radius * quality_factor if shape == "circle" else radius))
-            d = s * 2 + 1
-            k = np.zeros((d, d), np.uint8)
-            if shape == "circle":
-                k = cv2.circle(k, (s, s), s, 1, -1)
-            else:
-                k += 1
-
-            if radius > 0:
-                dilated_mask = cv2.dilate(frame_mask, k, iterations=int(1 / quality_factor if shape == "circle" else 1))
-            else:
-                dilated_mask = cv2.erode(frame_mask, k, iterations=int(1 / quality_factor if shape == "circle" else 1))
-
-            result_images[index] = dilated_mask
-
-            # Check if the entire frame is covered by the mask
-            if np.all(dilated_mask == 1):
-                result_images[index:] = 1
-                break
-
-        return result_images
-
-    def dilate_mask_with_amplitude(self, mask, normalized_amp, mask_colors, threshold, dilation_speed, quality_factor, should_composite_subject, subject_mask_color, initial_background_color, start_frame, end_frame):
-        dup = copy.deepcopy(mask.cpu().numpy())
-        num_frames, height, width = mask.shape[:3]
+        shape = "circle" if quality_factor >= epsilon else "square"
+        factor = PREVIEW_SCALES[preview_scale]
+        masks, fields = resolve_mask_fields(mask, distance_field, shape, factor)
+        num_frames, height, width = masks.shape
         colors = self.parse_colors(mask_colors)
-        all_dilated_masks = []
-
-        # Convert normalize_amp into a float list from numpy array if it is not already a list
-        if not isinstance(normalized_amp, list):
-            normalized_amp = normalized_amp.tolist()
-
-        dilating = False  # Track whether we are in the dilating or decaying phase
-        current_color_index = 0
-
-        for index, amp in enumerate(normalized_amp):
-            if index < start_frame:
-                continue
-            if end_frame > 0 and index >= end_frame:
-                break
-            if amp > threshold and not dilating:  # Start dilating if a beat is detected and not already dilating
-                dilating = True
-                start_frame = index
-                color = colors[current_color_index % len(colors)]
-                current_color_index += 1
-                dilated_masks = self.dilate_mask(dup, dilation_speed, start_frame, num_frames, width, height, quality_factor)
-                all_dilated_masks.append((dilated_masks, color))
-            elif amp <= threshold:
-                dilating = False
 
+        # A beat starts a layer when the amplitude rises above the threshold within [start_frame, end_frame)
+        first_frame = max(start_frame, 0)
+        if trigger_frames is not None:
+            frames = np.asarray(trigger_frames, dtype=np.float64).flatten()
+            keep = frames >= first_frame
+            if end_frame > 0:
+                keep &= frames < end_frame
+            schedule = DilationSchedule.from_frames(frames[keep], dilation_speed / factor, colors)
+        elif normalized_amp is not None:
+            amps = np.asarray(normalized_amp, dtype=np.float64).flatten()
+            last_frame = end_frame if end_frame > 0 else len(amps)
+            schedule = DilationSchedule.from_triggers(amps[first_frame:last_frame], threshold, dilation_speed / factor, colors, first_frame)
+        else:
+            raise ValueError("Connect either normalized_amp or trigger_frames.")
+        schedule = schedule.with_default_feather(feather / factor)
+
+        renderer = LayerRenderer(fields, schedule.layers(), num_frames)
+        resident_bytes = distance_field.nbytes if distance_field is not None else 0
+        fields.cache_limit = cache_limit((num_frames, height, width, 3), output_mode, ram_limit_mb, sink != "none", resident_bytes)
         initial_bg_color = tuple(map(int, initial_background_color.split(',')))
-        result_images = np.zeros((num_frames, height, width, 3), dtype=np.uint8)
-        result_images[:] = initial_bg_color  # Set initial background color
-
-        for index in range(num_frames):
-            composite_image = np.zeros((height, width, 3), dtype=np.uint8)
-            composite_image[:] = initial_bg_color  # Ensure initial background color is set for each frame
-            for dilated_masks, color in all_dilated_masks:
-                mask_frame = dilated_masks[index]
-                colored_mask = np.zeros((height, width, 3), dtype=np.uint8)
-                colored_mask[mask_frame > 0] = color
-                composite_image[mask_frame > 0] = color
-
-            result_images[index] = composite_image
-            
+        subject_masks = None
+        subject_color = None
         if should_composite_subject:
+            subject_masks = masks
             subject_color = tuple(map(int, subject_mask_color.split(',')))
-            for index in range(num_frames):
-                subject_mask = mask[index]
-                result_images[index][subject_mask > 0] = subject_color
 
-        result_images = result_images.astype(np.float32) / 255.0  # Normalize to [0, 1]
-        result = torch.from_numpy(result_images).float()  # Ensure float type
-        return (result,)
\ No newline at end of file
+        if sink != "none":
+            with FrameSink(sink_path, sink, sink_fps, prefix="ak_dilation") as frame_sink:
+                result = composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, preview_factor=factor, sink=frame_sink, frame_size=(height, width))
+            path, frame_count = frame_sink.path, frame_sink.frame_count
+        else:
+            result = allocate_frames((num_frames, height, width, 3), output_mode, scratch_dir, ram_limit_mb)
+            composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, out=result, preview_factor=factor)
+            path, frame_count = "", num_frames
+        return (result, preview_error(factor), renderer.coverage_frame(), fields.dedup_ratio(range(num_frames)), path, frame_count)
\ No newline at end of file
@@ -1,8 +1,8 @@
 import numpy as np
-import copy
-import cv2
-import torch
 import math
+from ..modules.dilation import PREVIEW_SCALES, dilate_mask_frames, cache_info, cache_report, preview_error
+from ..modules.distance_field import resolve_mask
+from ..modules.torch_dilation import BACKENDS
 
 PI = math.pi
 
@@ -14,7 +14,6 @@ class AK_AudioreactiveDilationMask:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "mask": ("MASK",),
                 "normalized_amp": ("*", {"defaultInput": True}),
                 "fps": ("INT", {
                     "default": 30,  # Default FPS
@@ -46,6 +45,26 @@ class AK_AudioreactiveDilationMask:
                     "display": "number"}),
                 "attack_function": (["linear", "ease-in", "ease-out", "ease-in-out"],),
                 "decay_function": (["linear", "ease-in", "ease-out", "ease-in-out"],),
+                "backend": (BACKENDS,),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+                "feather": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 1024.0,
+                    "step": 0.5,
+                    "display": "number",
+                }),
+            },
+            "optional": {
+                "mask": ("MASK",),
+                "distance_field": ("DISTANCE_FIELD",),
             },
         }
 
@@ -53,12 +72,13 @@ class AK_AudioreactiveDilationMask:
     def VALIDATE_INPUTS(cls, input_types):
         if input_types["normalized_amp"] not in ("NORMALIZED_AMPLITUDE", "FLOAT"):
             return "normalized_amp must be an NORMALIZED_AMPLITUDE or FLOAT type"
-        if input_types["mask"] != "MASK":
+        if input_types.get("mask", "MASK") != "MASK":
             return "mask must be a MASK type"
         return True
 
     CATEGORY = "💜Akatz Nodes/Mask"
-    RETURN_TYPES = ("MASK",)
+    RETURN_TYPES = ("MASK", "FLOAT", "FLOAT", "FLOAT", "STRING")
+    RETURN_NAMES = ("mask", "radii", "max_error_px", "dedup_ratio", "cache_reuse")
     FUNCTION = "dilate_mask_with_amplitude"
     DESCRIPTION = """
     # Dilate Mask with Amplitude
@@ -73,16 +93,15 @@ class AK_AudioreactiveDilationMask:
     - decay: The decay duration in seconds
     - attack_function: The attack easing function
     - decay_function: The decay easing function
+    - backend: "opencv" dilates each frame exactly, "torch" dilates the whole batch on the mask's device (circles approximated by octagons, within about 4% of the radius plus a pixel)
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - feather: Width in pixels over which the dilated edge fades out, 0 keeps hard edges (read off the same distance field, so no blur pass is needed; always uses the opencv path)
+    - radii (output): The dilation radius applied to each frame
+    - dedup_ratio (output): Dilations requested per distinct (mask frame, radius) pair, identical frames are dilated once
+    - cache_reuse (output): Dilations of this run read off an already computed distance field vs distance transforms computed, and structuring elements reused vs built (the torch backend uses neither)
     """
 
-    def create_circular_kernel(self, radius):
-        d = 2 * radius + 1
-        y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
-        mask = x * x + y * y <= radius * radius
-        kernel = np.zeros((d, d), dtype=np.uint8)
-        kernel[mask] = 1
-        return kernel
-
     def ease_in_sin(self, t):
         return 1 - math.cos((t * PI) / 2)
 
@@ -108,52 +127,73 @@ class AK_AudioreactiveDilationMask:
         else:  # linear
             return self.linear(t)
 
-    def dilate_mask_with_amplitude(self, mask, normalized_amp, fps=30, shape="circle", max_radius=25, min_radius=0, threshold=0.5, attack=0.5, decay=0.5, attack_function="linear", decay_function="linear"):
-        dup = copy.deepcopy(mask.cpu().numpy())
-        current_radius = 0
-        radius_progress = 0
-        
-        # Convert normalize_amp into a float list from numpy array if it is not already a list
-        if not isinstance(normalized_amp, list):
-            normalized_amp = normalized_amp.tolist()
+    def ramp(self, progress, step, count, func, stop_at_one):
+        """Progress of up to count attack (stop_at_one) or decay frames starting from progress."""
+        if func == "linear":
+            # Sequential cumsum reproduces the frame-by-frame additions exactly
+            values = np.cumsum(np.concatenate(([progress], np.full(count, step))))[1:]
+            if stop_at_one:
+                reached = np.flatnonzero(values >= 1.0)
+                if len(reached):
+                    values = values[:reached[0] + 1]
+                    values[-1] = 1.0
+            return np.maximum(values, 0.0)
+
+        # Eased progress feeds back into the next step, so it can only be iterated
+        values = []
+        for _ in range(count):
+            progress = self.apply_easing(progress + step, 1.0, func)
+            if stop_at_one and progress >= 1.0:
+                values.append(1.0)
+                break
+            if not stop_at_one and progress <= 0.0:
+                progress = 0.0
+            values.append(progress)
+        return np.array(values)
+
+    def envelope(self, gates, attack_frames, decay_frames, attack_function, decay_function):
+        """
+        Per-frame radius progress (0 to 1) of the attack/decay envelope.
+
+        A frame above the threshold starts an attack that runs until the progress
+        reaches 1, and every other frame decays. The pass jumps from trigger to
+        trigger and fills whole attack and decay segments at once.
+        """
+        progress = np.zeros(len(gates))
+        triggers = np.flatnonzero(gates)
+        current = 0.0
+        index = 0
+        while index < len(gates):
+            position = np.searchsorted(triggers, index)
+            next_trigger = triggers[position] if position < len(triggers) else len(gates)
+            if next_trigger > index:
+                segment = self.ramp(current, -1 / decay_frames, next_trigger - index, decay_function, stop_at_one=False)
+            else:
+                segment = self.ramp(current, 1 / attack_frames, len(gates) - index, attack_function, stop_at_one=True)
+            progress[index:index + len(segment)] = segment
+            current = segment[-1]
+            index += len(segment)
+        return progress
+
+    def dilate_mask_with_amplitude(self, mask=None, normalized_amp=None, fps=30, shape="circle", max_radius=25, min_radius=0, threshold=0.5, attack=0.5, decay=0.5, attack_function="linear", decay_function="linear", backend="opencv", workers=0, preview_scale="1", feather=0.0, distance_field=None):
+        mask = resolve_mask(mask, distance_field)
+        num_frames = mask.shape[0]
+        amps = np.asarray(normalized_amp, dtype=np.float64).flatten()[:num_frames]
 
         # Convert attack and decay from seconds to frames
         attack_frames = max(attack * fps, 1)
         decay_frames = max(decay * fps, 1)
 
-        # Pre-compute circular kernels if shape is "circle"
-        if shape == "circle":
-            circular_kernels = [self.create_circular_kernel(r) for r in range(max_radius + 1)]
-
-        dilating = False  # Track whether we are in the dilating or decaying phase
-
-        for index, (mask, amp) in enumerate(zip(dup, normalized_amp)):
-            if amp > threshold and not dilating:  # Start dilating if a beat is detected and not already dilating
-                dilating = True
-            
-            if dilating:
-                radius_progress += 1 / attack_frames  # Increment based on frames
-                radius_progress = self.apply_easing(radius_progress, 1.0, attack_function)
-                if radius_progress >= 1.0:
-                    dilating = False  # Start decaying after reaching max_radius
-                    radius_progress = 1.0
-            else:
-                radius_progress -= 1 / decay_frames  # Decrement based on frames
-                radius_progress = self.apply_easing(radius_progress, 1.0, decay_function)
-                if radius_progress <= 0.0:
-                    radius_progress = 0.0
-            
-            current_radius = max(radius_progress * max_radius, min_radius)
-            
-            if current_radius <= 0:
-                continue
-            
-            if shape == "circle":
-                k = circular_kernels[int(current_radius)]
-            else:
-                d = 2 * int(current_radius) + 1
-                k = np.ones((d, d), np.uint8)
-            
-            dup[index] = cv2.dilate(mask, k, iterations=1)
-        
-        return (torch.from_numpy(dup),)
\ No newline at end of file
+        progress = self.envelope(amps > threshold, attack_frames, decay_frames, attack_function, decay_function)
+        envelope_radii = np.maximum(progress * max_radius, min_radius)
+        dilated_frames = np.flatnonzero(envelope_radii > 0).tolist()
+        radii = envelope_radii[dilated_frames].astype(np.int64).tolist()
+
+        applied_radii = np.zeros(len(amps))
+        applied_radii[dilated_frames] = radii
+
+        factor = PREVIEW_SCALES[preview_scale]
+        caches_before = cache_info()
+        result, _, ratio = dilate_mask_frames(mask, dilated_frames, radii, shape, backend, workers, factor, feather, distance_field)
+        max_error = preview_error(factor, backend, shape if distance_field is None else distance_field.shape, max(radii, default=0))
+        return (result, applied_radii.tolist(), max_error, ratio, cache_report(caches_before))
\ No newline at end of file
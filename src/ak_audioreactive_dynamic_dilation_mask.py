@@ -1,10 +1,6 @@
-import numpy as np
-import copy
-import cv2
-import torch
-import math
-
-PI = math.pi
+from ..modules.dilation import PREVIEW_SCALES, dilate_mask_frames, cache_info, cache_report, preview_error
+from ..modules.distance_field import resolve_mask
+from ..modules.torch_dilation import BACKENDS
 
 class AK_AudioreactiveDynamicDilationMask:
     def __init__(self):
@@ -14,7 +10,6 @@ class AK_AudioreactiveDynamicDilationMask:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "mask": ("MASK",),
                 "normalized_amp": ("*", {"defaultInput": True}),
                 "shape": (["circle","square"],),
                 "max_radius": ("INT",{
@@ -30,6 +25,26 @@ class AK_AudioreactiveDynamicDilationMask:
                     "step": 0.01,
                     "display": "number",
                 }),
+                "backend": (BACKENDS,),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+                "feather": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 1024.0,
+                    "step": 0.5,
+                    "display": "number",
+                }),
+            },
+            "optional": {
+                "mask": ("MASK",),
+                "distance_field": ("DISTANCE_FIELD",),
             },
         }
         
@@ -37,12 +52,13 @@ class AK_AudioreactiveDynamicDilationMask:
     def VALIDATE_INPUTS(cls, input_types):
         if input_types["normalized_amp"] not in ("NORMALIZED_AMPLITUDE", "FLOAT"):
             return "normalized_amp must be an NORMALIZED_AMPLITUDE or FLOAT type"
-        if input_types["mask"] != "MASK":
+        if input_types.get("mask", "MASK") != "MASK":
             return "mask must be a MASK type"
         return True
 
     CATEGORY = "💜Akatz Nodes/Mask"
-    RETURN_TYPES = ("MASK",)
+    RETURN_TYPES = ("MASK", "FLOAT", "FLOAT", "STRING")
+    RETURN_NAMES = ("mask", "max_error_px", "dedup_ratio", "cache_reuse")
     FUNCTION = "dilate_mask_with_amplitude"
     DESCRIPTION = """
     # Dilate Mask dynamically based on Amplitude
@@ -51,19 +67,18 @@ class AK_AudioreactiveDynamicDilationMask:
     - shape: The shape of the dilation
     - max_radius: The maximum radius of the dilation
     - min_radius: The minimum radius of the dilation
-    - quality_factor: The quality factor of the dilation
+    - quality_factor: 0 forces a square dilation, otherwise the shape is dilated exactly
+    - backend: "opencv" dilates each frame exactly, "torch" dilates the whole batch on the mask's device (circles approximated by octagons, within about 4% of the radius plus a pixel)
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - feather: Width in pixels over which the dilated edge fades out, 0 keeps hard edges (read off the same distance field, so no blur pass is needed; always uses the opencv path)
+    - dedup_ratio (output): Dilations requested per distinct (mask frame, radius) pair, identical frames are dilated once
+    - cache_reuse (output): Dilations of this run read off an already computed distance field vs distance transforms computed, and structuring elements reused vs built (the torch backend uses neither)
     """
     
-    def create_circular_kernel(self, radius):
-        d = 2 * radius + 1
-        y, x = np.ogrid[-radius:radius+1, -radius:radius+1]
-        mask = x*x + y*y <= radius*radius
-        kernel = np.zeros((d, d), dtype=np.uint8)
-        kernel[mask] = 1
-        return kernel
-
-    def dilate_mask_with_amplitude(self, mask, normalized_amp, shape="circle", max_radius=25, min_radius=0, quality_factor=0.25):
-        dup = copy.deepcopy(mask.cpu().numpy())
+    def dilate_mask_with_amplitude(self, mask=None, normalized_amp=None, shape="circle", max_radius=25, min_radius=0, quality_factor=0.25, backend="opencv", workers=0, preview_scale="1", feather=0.0, distance_field=None):
+        mask = resolve_mask(mask, distance_field)
+        num_frames = mask.shape[0]
         
         # Convert normalize_amp into a float list from numpy array if it is not already a list
         if not isinstance(normalized_amp, list):
@@ -73,29 +88,21 @@ class AK_AudioreactiveDynamicDilationMask:
         if quality_factor < epsilon:
             shape = "square"
 
-        for index, (mask_frame, amp) in enumerate(zip(dup, normalized_amp)):
+        dilated_frames = []
+        radii = []
+
+        for index, amp in enumerate(normalized_amp[:num_frames]):
             # Scale the amplitude to fluctuate between min_radius and max_radius
             radius = min_radius + amp * (max_radius - min_radius)
 
             if radius <= 0:
                 continue
 
-            s = abs(int(radius * quality_factor if shape == "circle" else radius))
-            d = s * 2 + 1
-
-            if shape == "circle":
-                k = np.zeros((d, d), np.uint8)
-                k = cv2.circle(k, (s, s), s, 1, -1)
-            else:
-                k = np.ones((d, d), np.uint8)
+            dilated_frames.append(index)
+            radii.append(radius)
 
-            iterations = int(1 / quality_factor if quality_factor >= epsilon else 1)
-
-            if radius > 0:
-                dilated_mask = cv2.dilate(mask_frame, k, iterations=iterations)
-            else:
-                dilated_mask = cv2.erode(mask_frame, k, iterations=iterations)
-
-            dup[index] = dilated_mask
-        
-        return (torch.from_numpy(dup),)
\ No newline at end of file
+        factor = PREVIEW_SCALES[preview_scale]
+        caches_before = cache_info()
+        result, _, ratio = dilate_mask_frames(mask, dilated_frames, radii, shape, backend, workers, factor, feather, distance_field)
+        max_error = preview_error(factor, backend, shape if distance_field is None else distance_field.shape, max(radii, default=0))
+        return (result, max_error, ratio, cache_report(caches_before))
\ No newline at end of file
@@ -1,6 +1,7 @@
 import numpy as np
 import torch
 import cv2
+from ..modules.frame_sink import SINK_FORMATS, FrameSink
 
 class AK_BlobTrack:
     @classmethod
@@ -58,10 +59,14 @@ class AK_BlobTrack:
                     "step": 0.01,
                     "display": "number"
                 }),
+                "sink": (SINK_FORMATS,),
+                "sink_path": ("STRING", {"default": ""}),
+                "sink_fps": ("INT", {"default": 30, "min": 1, "max": 240, "step": 1, "display": "number"}),
             }
         }
 
-    RETURN_TYPES = ("IMAGE", "MASK")
+    RETURN_TYPES = ("IMAGE", "MASK", "STRING", "INT")
+    RETURN_NAMES = ("image", "mask", "path", "frame_count")
     FUNCTION = "track_blobs"
     CATEGORY = "💜Akatz Nodes/Tracking"
     DESCRIPTION = """
@@ -74,8 +79,13 @@ class AK_BlobTrack:
        - A fully filled white rectangle for the blob in the mask.
     4. Also draws connecting lines between blob centers in composite.
        - If line_alpha > 0, the lines are drawn in the mask; otherwise, they are skipped.
+    5. With a sink ("mp4", "png" or "npy"), composite frames are streamed to sink_path in
+       chunks instead of being kept; image and mask then hold only the last frame, and
+       path and frame_count describe what was written.
     """
 
+    SINK_CHUNK_SIZE = 16
+
     ### COLOR PARSING UTILS ###
     def parse_hex_color(self, hex_str):
         h = hex_str.lstrip('#')
@@ -155,7 +165,10 @@ class AK_BlobTrack:
                     blob_outline_alpha=1.0,
                     line_thickness=2,
                     line_color="#00ff00",
-                    line_alpha=1.0
+                    line_alpha=1.0,
+                    sink="none",
+                    sink_path="",
+                    sink_fps=30
                     ):
 
         # Convert input to np.uint8 [0..255]
@@ -169,8 +182,12 @@ class AK_BlobTrack:
             image_np = image_np.astype(np.uint8)
 
         batch_size, height, width, channels = image_np.shape
-        composite_frames = np.zeros_like(image_np, dtype=np.uint8)
-        mask_frames = np.zeros((batch_size, height, width), dtype=np.float32)
+
+        # Streaming keeps one chunk of output frames, otherwise the whole batch
+        streaming = sink != "none"
+        frames_held = self.SINK_CHUNK_SIZE if streaming else batch_size
+        composite_frames = np.zeros((frames_held, height, width, channels), dtype=np.uint8)
+        mask_frames = np.zeros((frames_held, height, width), dtype=np.float32)
 
         # Convert booleans from input strings
         filter_area_bool = (filter_by_area.lower() == "true")
@@ -197,52 +214,67 @@ class AK_BlobTrack:
                 return arr[i]
             return np.mean(ref_frames, axis=0).astype(np.uint8)
 
-        for i in range(batch_size):
-            current_frame = image_np[i]
-            ref_frame = get_reference_frame(image_np, i)
-            diff_frame = cv2.absdiff(current_frame, ref_frame)
-
-            gray = cv2.cvtColor(diff_frame, cv2.COLOR_BGR2GRAY)
-            _, thresh = cv2.threshold(gray, int(diff_threshold), 255, cv2.THRESH_BINARY)
-
-            keypoints = detector.detect(thresh)
-            keypoints = sorted(keypoints, key=lambda kp: kp.size, reverse=True)[:max_blobs]
-
-            drawn_frame = current_frame.copy()
-            mask_frame = np.zeros((height, width), dtype=np.uint8)
-            centers = []
-
-            for kp in keypoints:
-                cx = int(round(kp.pt[0]))
-                cy = int(round(kp.pt[1]))
-                size_i = int(round(kp.size))
-                half_w = size_i // 2
-                top_left = (cx - half_w, cy - half_w)
-                bottom_right = (cx + half_w, cy + half_w)
-
-                # Draw outline on composite
-                self.draw_rect_alpha(drawn_frame, top_left, bottom_right,
-                                     blob_rgb, blob_outline_alpha,
-                                     thickness=blob_outline_thickness)
-
-                # Draw filled rectangle on mask
-                cv2.rectangle(mask_frame, top_left, bottom_right, 255, thickness=-1)
-
-                centers.append((cx, cy))
-
-            # Draw lines connecting blob centers
-            for idx in range(len(centers) - 1):
-                pt1, pt2 = centers[idx], centers[idx+1]
-                self.draw_line_alpha(drawn_frame, pt1, pt2,
-                                     line_rgb, line_alpha,
-                                     thickness=line_thickness)
-                # Only draw lines in mask if line_alpha is non-zero
-                if line_alpha > 0:
-                    cv2.line(mask_frame, pt1, pt2, 255, thickness=line_thickness)
-
-            composite_frames[i] = drawn_frame
-            mask_frames[i] = mask_frame.astype(np.float32) / 255.0
+        def render(frame_sink=None):
+            for i in range(batch_size):
+                current_frame = image_np[i]
+                ref_frame = get_reference_frame(image_np, i)
+                diff_frame = cv2.absdiff(current_frame, ref_frame)
+
+                gray = cv2.cvtColor(diff_frame, cv2.COLOR_BGR2GRAY)
+                _, thresh = cv2.threshold(gray, int(diff_threshold), 255, cv2.THRESH_BINARY)
+
+                keypoints = detector.detect(thresh)
+                keypoints = sorted(keypoints, key=lambda kp: kp.size, reverse=True)[:max_blobs]
+
+                drawn_frame = current_frame.copy()
+                mask_frame = np.zeros((height, width), dtype=np.uint8)
+                centers = []
+
+                for kp in keypoints:
+                    cx = int(round(kp.pt[0]))
+                    cy = int(round(kp.pt[1]))
+                    size_i = int(round(kp.size))
+                    half_w = size_i // 2
+                    top_left = (cx - half_w, cy - half_w)
+                    bottom_right = (cx + half_w, cy + half_w)
+
+                    # Draw outline on composite
+                    self.draw_rect_alpha(drawn_frame, top_left, bottom_right,
+                                         blob_rgb, blob_outline_alpha,
+                                         thickness=blob_outline_thickness)
+
+                    # Draw filled rectangle on mask
+                    cv2.rectangle(mask_frame, top_left, bottom_right, 255, thickness=-1)
+
+                    centers.append((cx, cy))
+
+                # Draw lines connecting blob centers
+                for idx in range(len(centers) - 1):
+                    pt1, pt2 = centers[idx], centers[idx+1]
+                    self.draw_line_alpha(drawn_frame, pt1, pt2,
+                                         line_rgb, line_alpha,
+                                         thickness=line_thickness)
+                    # Only draw lines in mask if line_alpha is non-zero
+                    if line_alpha > 0:
+                        cv2.line(mask_frame, pt1, pt2, 255, thickness=line_thickness)
+
+                slot = i % frames_held
+                composite_frames[slot] = drawn_frame
+                mask_frames[slot] = mask_frame.astype(np.float32) / 255.0
+                if streaming and (slot == frames_held - 1 or i == batch_size - 1):
+                    frame_sink.write(composite_frames[:slot + 1])
+
+        if streaming:
+            with FrameSink(sink_path, sink, sink_fps, prefix="ak_blob_track") as frame_sink:
+                render(frame_sink)
+            path, frame_count = frame_sink.path, frame_sink.frame_count
+            last = (batch_size - 1) % frames_held
+            composite_frames = composite_frames[last:last + 1]
+            mask_frames = mask_frames[last:last + 1]
+        else:
+            render()
+            path, frame_count = "", batch_size
 
         out_composite = torch.from_numpy(composite_frames.astype(np.float32)/255.0)
         out_mask = torch.from_numpy(mask_frames)
-        return (out_composite, out_mask)
+        return (out_composite, out_mask, path, frame_count)
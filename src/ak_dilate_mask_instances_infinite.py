@@ -0,0 +1,165 @@
+import re
+from ..modules.dilation import PREVIEW_SCALES, PackedMasks, composite_layers, preview_error
+from ..modules.frame_output import OUTPUT_MODES, allocate_frames, cache_limit
+from ..modules.frame_sink import SINK_FORMATS, FrameSink
+from ..modules.instance_dilation import INSTANCE_MODES, InstanceFields, InstanceRenderer
+
+class AK_DilateMaskInstancesInfinite:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "mask": ("MASK",),
+                "instance_mode": (INSTANCE_MODES,),
+                "instance_speeds": ("STRING", {
+                    "default": "30",
+                }),
+                "instance_colors": ("STRING", {
+                    "default": '(255, 0, 0), (0, 255, 0), (0, 0, 255)',
+                    "multiline": True,
+                }),
+                "start_frame": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                }),
+                "quality_factor": ("FLOAT", {
+                    "default": 0.25,
+                    "min": 0.0,
+                    "max": 1.0,
+                    "step": 0.01,
+                    "display": "number",
+                }),
+                "should_composite_subject": ("BOOLEAN", {
+                    "default": False,
+                }),
+                "subject_mask_color": ("STRING", {
+                    "default": "255, 0, 0",
+                }),
+                "initial_background_color": ("STRING", {
+                    "default": "0, 0, 0",
+                }),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "output_mode": (OUTPUT_MODES,),
+                "scratch_dir": ("STRING", {
+                    "default": "",
+                }),
+                "ram_limit_mb": ("INT", {
+                    "default": 4096,
+                    "min": 0,
+                    "step": 256,
+                    "display": "number",
+                }),
+                "sink": (SINK_FORMATS,),
+                "sink_path": ("STRING", {
+                    "default": "",
+                }),
+                "sink_fps": ("INT", {
+                    "default": 30,
+                    "min": 1,
+                    "max": 240,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "instance_feathers": ("STRING", {
+                    "default": "0",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+            },
+        }
+
+    CATEGORY = "💜Akatz Nodes/Mask"
+    RETURN_TYPES = ("IMAGE", "INT", "FLOAT", "STRING", "INT")
+    RETURN_NAMES = ("image", "instance_count", "max_error_px", "path", "frame_count")
+    FUNCTION = "dilate_mask_instances_infinite"
+    DESCRIPTION = """
+    # Dilate Mask Instances Infinite
+    Grows every instance of a mask with its own speed and color in a single pass.
+    Each pixel belongs to its nearest instance, so with equal speeds the result matches
+    chaining one Dilate Mask Linear Infinite per instance.
+    - mask: Input mask or mask batch
+    - instance_mode: "connected_components" splits the mask into blobs (numbered in scan order per frame),
+      "mask_values" makes every distinct mask value an instance (stable across frames)
+    - instance_speeds: Dilation speed per instance in pixels per frame, e.g. "30, 20, 10" (cycled)
+    - instance_colors: Color per instance in the format "(r, g, b), (r, g, b), ..." (cycled)
+    - start_frame: Frame at which all instances start growing
+    - quality_factor: 0 dilates with a square, any other value with a circle
+    - should_composite_subject: Boolean to composite the subject mask over the final result
+    - subject_mask_color: Color for the subject mask in the format "R, G, B"
+    - initial_background_color: Color for the initial background in the format "R, G, B"
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - output_mode: "memory" keeps the output in RAM, "memmap" writes it to a disk-backed buffer, "auto" uses the disk only above ram_limit_mb
+    - scratch_dir: Directory for disk-backed output (empty uses the system temp directory)
+    - ram_limit_mb: Largest output kept in RAM in "auto" mode; with "memmap", "auto" or a sink it also bounds the distance fields kept in RAM, which are then computed as frames are rendered
+    - sink: Stream the frames to disk as they are rendered ("mp4" video, "png" or "npy" sequence) instead of returning the whole batch; image then holds only the last frame
+    - sink_path: Video file (.mp4) or directory for the sink output (empty uses the system temp directory)
+    - sink_fps: Frame rate of the "mp4" sink
+    - instance_feathers: Width in pixels over which each instance's edge fades out, e.g. "0, 8" (cycled, 0 keeps hard edges); the fade stops at the edge of the instance's cell
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - instance_count (output): Number of instances found
+    - max_error_px (output): Largest boundary shift of the preview from the full-resolution result, in pixels
+    - path (output): Where the sink wrote the frames (empty without a sink)
+    - frame_count (output): Number of frames rendered
+    """
+
+    def parse_colors(self, colors_str):
+        pattern = r'\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)\s*,?'
+        matches = re.findall(pattern, colors_str)
+        if not matches:
+            return [(255, 255, 0), (255, 0, 255)]  # Default to yellow and magenta
+        return [(int(r), int(g), int(b)) for r, g, b in matches]
+
+    def parse_speeds(self, speeds_str):
+        speeds = [float(speed) for speed in re.findall(r'\d*\.?\d+', speeds_str)]
+        if not speeds:
+            raise ValueError("No valid speeds found in instance_speeds.")
+        return speeds
+
+    def parse_feathers(self, feathers_str):
+        return [float(feather) for feather in re.findall(r'\d*\.?\d+', feathers_str)] or [0.0]
+
+    def dilate_mask_instances_infinite(self, mask, instance_mode, instance_speeds, instance_colors, start_frame, quality_factor, should_composite_subject, subject_mask_color, initial_background_color, workers=0, output_mode="memory", scratch_dir="", ram_limit_mb=4096, sink="none", sink_path="", sink_fps=30, instance_feathers="0", preview_scale="1"):
+        epsilon = 1e-6
+        shape = "circle" if quality_factor >= epsilon else "square"
+        if mask.ndim == 2:
+            mask = mask[None]
+        num_frames, height, width = mask.shape[:3]
+        factor = PREVIEW_SCALES[preview_scale]
+        fields = InstanceFields(mask, instance_mode, shape, factor)
+        fields.cache_limit = cache_limit((num_frames, height, width, 3), output_mode, ram_limit_mb, sink != "none")
+        speeds = self.parse_speeds(instance_speeds)
+        colors = self.parse_colors(instance_colors)
+        feathers = self.parse_feathers(instance_feathers)
+
+        instance_count = fields.instance_count(workers)
+        # Preview instances grow in preview pixels per frame
+        layers = [
+            (start_frame, speeds[i % len(speeds)] / factor, colors[i % len(colors)], feathers[i % len(feathers)] / factor)
+            for i in range(instance_count)
+        ]
+        renderer = InstanceRenderer(fields, layers, num_frames)
+
+        initial_bg_color = tuple(map(int, initial_background_color.split(',')))
+        subject_masks = None
+        subject_color = None
+        if should_composite_subject:
+            subject_masks = fields.masks if factor == 1 else PackedMasks.from_mask(mask)
+            subject_color = tuple(map(int, subject_mask_color.split(',')))
+
+        if sink != "none":
+            with FrameSink(sink_path, sink, sink_fps, prefix="ak_dilation") as frame_sink:
+                result = composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, preview_factor=factor, sink=frame_sink, frame_size=(height, width))
+            path, frame_count = frame_sink.path, frame_sink.frame_count
+        else:
+            result = allocate_frames((num_frames, height, width, 3), output_mode, scratch_dir, ram_limit_mb)
+            composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, out=result, preview_factor=factor)
+            path, frame_count = "", num_frames
+        return (result, instance_count, preview_error(factor), path, frame_count)
@@ -1,9 +1,9 @@
 import numpy as np
-import copy
-import cv2
-import torch
-import re
-import math
+from ..modules.dilation import PREVIEW_SCALES, LayerRenderer, composite_layers, preview_error
+from ..modules.dilation_schedule import DilationSchedule
+from ..modules.distance_field import resolve_mask_fields
+from ..modules.frame_output import OUTPUT_MODES, allocate_frames, cache_limit
+from ..modules.frame_sink import SINK_FORMATS, FrameSink
 
 class AK_DilateMaskLinearInfinite:
     def __init__(self):
@@ -13,7 +13,6 @@ class AK_DilateMaskLinearInfinite:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "mask": ("MASK",),
                 "dilation_schedule": ("STRING", {
                     "default": '(0, 30, (0, 255, 0)),',
                     "multiline": True,
@@ -35,119 +34,121 @@ class AK_DilateMaskLinearInfinite:
                 "initial_background_color": ("STRING", {
                     "default": "0, 0, 0",
                 }),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "output_mode": (OUTPUT_MODES,),
+                "scratch_dir": ("STRING", {
+                    "default": "",
+                }),
+                "ram_limit_mb": ("INT", {
+                    "default": 4096,
+                    "min": 0,
+                    "step": 256,
+                    "display": "number",
+                }),
+                "sink": (SINK_FORMATS,),
+                "sink_path": ("STRING", {
+                    "default": "",
+                }),
+                "sink_fps": ("INT", {
+                    "default": 30,
+                    "min": 1,
+                    "max": 240,
+                    "step": 1,
+                    "display": "number",
+                }),
+                "preview_scale": (list(PREVIEW_SCALES),),
+                "feather": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 1024.0,
+                    "step": 0.5,
+                    "display": "number",
+                }),
+            },
+            "optional": {
+                "mask": ("MASK",),
+                "distance_field": ("DISTANCE_FIELD",),
+                "schedule": ("DILATION_SCHEDULE",),
             },
         }
 
     CATEGORY = "💜Akatz Nodes/Mask"
-    RETURN_TYPES = ("IMAGE",)
+    RETURN_TYPES = ("IMAGE", "FLOAT", "INT", "FLOAT", "STRING", "INT")
+    RETURN_NAMES = ("image", "max_error_px", "coverage_frame", "dedup_ratio", "path", "frame_count")
     FUNCTION = "dilate_mask_linear_infinite"
     DESCRIPTION = """
     # Dilate Mask Linear Infinite
-    - mask: Input mask or mask batch
+    - mask (optional): Input mask or mask batch
+    - distance_field (optional): Precomputed DISTANCE_FIELD used in place of mask, its shape replaces quality_factor
     - dilation_schedule: Schedule for mask dilations in the format:
-      (start_frame, dilation_speed, (r, g, b)),...
-    - quality_factor: Quality factor for dilation (recommend between 0.25 and 0.15 for good balance between quality and speed)
+      (start_frame, dilation_speed, (r, g, b)),... with an optional per-layer feather width:
+      (start_frame, dilation_speed, (r, g, b), feather),...
+    - schedule (optional): Structured DILATION_SCHEDULE, used instead of dilation_schedule when connected (start frames stay fractional)
+    - quality_factor: 0 dilates with a square, any other value with an exact circle (dilation cost no longer depends on it)
     - use_percentage: Boolean to specify if the start_frame is in percentage of the total frames
     - should_composite_subject: Boolean to composite the subject mask over the final result
     - subject_mask_color: Color for the subject mask in the format "R, G, B"
     - initial_background_color: Color for the initial background in the format "R, G, B"
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - output_mode: "memory" keeps the output in RAM, "memmap" writes it to a disk-backed buffer, "auto" uses the disk only above ram_limit_mb
+    - scratch_dir: Directory for disk-backed output (empty uses the system temp directory)
+    - ram_limit_mb: Largest output kept in RAM in "auto" mode; with "memmap", "auto" or a sink it also bounds the distance fields kept in RAM (a connected distance_field counts against it), which are then computed as frames are rendered
+    - sink: Stream the frames to disk as they are rendered ("mp4" video, "png" or "npy" sequence) instead of returning the whole batch; image then holds only the last frame
+    - sink_path: Video file (.mp4) or directory for the sink output (empty uses the system temp directory)
+    - sink_fps: Frame rate of the "mp4" sink
+    - preview_scale: Dilate at 1/2, 1/4 or 1/8 resolution for fast previews, max_error_px reports the largest boundary error
+    - feather: Width in pixels over which the edge of every layer without its own feather width fades out, 0 keeps hard edges (read off the same distance field, so no blur pass is needed)
+    - coverage_frame (output): First frame some layer fills completely, -1 if none does
+    - dedup_ratio (output): Mask frames per distinct mask frame, identical frames share one distance field
+    - path (output): Where the sink wrote the frames (empty without a sink)
+    - frame_count (output): Number of frames rendered
     """
 
     def parse_schedule(self, schedule_str, num_frames, timing_mode):
-        pattern = r'\(\s*(\d*\.?\d*)\s*,\s*(\d+)\s*,\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)\s*\)\s*,?'
-        matches = re.findall(pattern, schedule_str)
-        
-        if not matches:
-            raise ValueError("No valid matches found in the provided schedule string.")
-        
-        schedule = []
-        for match in matches:
-            start_frame, dilation_speed, r, g, b = match
-            start_frame = float(start_frame)
-            if timing_mode == "Percent":
-                start_frame = int(start_frame * num_frames)
-            else:
-                start_frame = int(start_frame)
-            dilation_speed = int(dilation_speed)
-            color = (int(r), int(g), int(b))
-            schedule.append((start_frame, dilation_speed, color))
-        
-        return schedule
+        schedule = DilationSchedule.from_string(schedule_str)
+        if timing_mode == "Percent":
+            schedule = schedule.scaled(start_scale=num_frames)
+        # The string form has always rendered from whole frames
+        return DilationSchedule(np.trunc(schedule.starts), schedule.speeds, schedule.colors, schedule.feathers)
 
-    def dilate_mask(self, mask, dilate_per_frame, start_frame, num_frames, width, height, quality_factor):
-        result_images = np.zeros((num_frames, height, width), dtype=np.uint8)
-        radius = 0
-        
-        shape = "circle"
+    def dilate_mask_linear_infinite(self, mask=None, dilation_schedule="(0, 30, (0, 255, 0)),", quality_factor=0.25, timing_mode="Frame", should_composite_subject=False, subject_mask_color="255, 0, 0", initial_background_color="0, 0, 0", workers=0, output_mode="memory", scratch_dir="", ram_limit_mb=4096, preview_scale="1", feather=0.0, schedule=None, distance_field=None, sink="none", sink_path="", sink_fps=30):
         epsilon = 1e-6
-        if quality_factor < epsilon:
-            shape = "square"
-
-        for index in range(num_frames):
-            if index < start_frame:
-                continue
-
-            frame_index = index
-            frame_mask = mask[frame_index] if frame_index < mask.shape[0] else mask[-1]
-
-            radius += dilate_per_frame
-
-            s = abs(int(radius * quality_factor if shape == "circle" else radius))
-            d = s * 2 + 1
-            k = np.zeros((d, d), np.uint8)
-            if shape == "circle":
-                k = cv2.circle(k, (s, s), s, 1, -1)
-            else:
-                k += 1
-
-            if radius > 0:
-                dilated_mask = cv2.dilate(frame_mask, k, iterations=int(1 / quality_factor if shape == "circle" else 1))
-            else:
-                dilated_mask = cv2.erode(frame_mask, k, iterations=int(1 / quality_factor if shape == "circle" else 1))
-
-            result_images[index] = dilated_mask
-
-            # Check if the entire frame is covered by the mask
-            if np.all(dilated_mask == 1):
-                result_images[index:] = 1
-                break
-
-        return result_images
-
-    def dilate_mask_linear_infinite(self, mask, dilation_schedule, quality_factor, timing_mode, should_composite_subject, subject_mask_color, initial_background_color):
-        dup = copy.deepcopy(mask.cpu().numpy())
-        num_frames, height, width = mask.shape[:3]
-        schedule = self.parse_schedule(dilation_schedule, num_frames, timing_mode)
-        all_dilated_masks = []
-
-        for start_frame, dilation_speed, color in schedule:
-            dilate_per_frame = dilation_speed
-            dilated_masks = self.dilate_mask(dup, dilate_per_frame, start_frame, num_frames, width, height, quality_factor)
-            all_dilated_masks.append((dilated_masks, color))
+        shape = "circle" if quality_factor >= epsilon else "square"
+        factor = PREVIEW_SCALES[preview_scale]
+        masks, fields = resolve_mask_fields(mask, distance_field, shape, factor)
+        num_frames, height, width = masks.shape
+        if schedule is None:
+            schedule = self.parse_schedule(dilation_schedule, num_frames, timing_mode)
+        elif timing_mode == "Percent":
+            schedule = schedule.scaled(start_scale=num_frames)
+        schedule = schedule.with_default_feather(feather)
+        # Preview layers grow in preview pixels per frame
+        renderer = LayerRenderer(fields, schedule.scaled(speed_scale=1 / factor).layers(), num_frames)
+        resident_bytes = distance_field.nbytes if distance_field is not None else 0
+        fields.cache_limit = cache_limit((num_frames, height, width, 3), output_mode, ram_limit_mb, sink != "none", resident_bytes)
 
         initial_bg_color = tuple(map(int, initial_background_color.split(',')))
-        result_images = np.zeros((num_frames, height, width, 3), dtype=np.uint8)
-                    
-        for index in range(num_frames):
-            composite_image = np.zeros((height, width, 3), dtype=np.uint8)
-            composite_image[:] = initial_bg_color  # Set initial background color
-            for dilated_masks, color in all_dilated_masks:
-                mask_frame = dilated_masks[index]
-                colored_mask = np.zeros((height, width, 3), dtype=np.uint8)
-                colored_mask[mask_frame > 0] = color
-                composite_image[mask_frame > 0] = color
-
-            result_images[index] = composite_image
-            
+        subject_masks = None
+        subject_color = None
         if should_composite_subject:
+            subject_masks = masks
             subject_color = tuple(map(int, subject_mask_color.split(',')))
-            for index in range(num_frames):
-                subject_mask = mask[index]
-                result_images[index][subject_mask > 0] = subject_color
 
-        result_images = result_images.astype(np.float32) / 255.0  # Normalize to [0, 1]
-        result = torch.from_numpy(result_images).float()  # Ensure float type
-        return (result,)
+        if sink != "none":
+            with FrameSink(sink_path, sink, sink_fps, prefix="ak_dilation") as frame_sink:
+                result = composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, preview_factor=factor, sink=frame_sink, frame_size=(height, width))
+            path, frame_count = frame_sink.path, frame_sink.frame_count
+        else:
+            result = allocate_frames((num_frames, height, width, 3), output_mode, scratch_dir, ram_limit_mb)
+            composite_layers(renderer, initial_bg_color, subject_masks, subject_color, workers=workers, out=result, preview_factor=factor)
+            path, frame_count = "", num_frames
+        return (result, preview_error(factor), renderer.coverage_frame(), fields.dedup_ratio(range(num_frames)), path, frame_count)
 
 
 # mask = inputs["0_mask"]
@@ -1,4 +1,5 @@
 import re
+from ..modules.dilation_schedule import DilationSchedule
 
 class AK_FloatListToDilateMaskSchedule:
     def __init__(self):
@@ -8,7 +9,6 @@ class AK_FloatListToDilateMaskSchedule:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "float_list": ("FLOAT", {"defaultInput": True}),
                 "mask_colors": ("STRING", {
                     "default": '(255, 255, 0), (255, 0, 255)',
                     "multiline": True,
@@ -27,18 +27,25 @@ class AK_FloatListToDilateMaskSchedule:
                     "display": "number"
                 }),
             },
+            "optional": {
+                "float_list": ("FLOAT", {"defaultInput": True}),
+                "trigger_frames": ("LIST",),
+            },
         }
 
     CATEGORY = "💜Akatz Nodes/Utils"
-    RETURN_TYPES = ("STRING",)
+    RETURN_TYPES = ("STRING", "DILATION_SCHEDULE")
+    RETURN_NAMES = ("schedule_string", "schedule")
     FUNCTION = "float_list_to_dilate_mask_schedule"
     DESCRIPTION = """
     # Float List to Dilate Mask Schedule
-    - float_list: Input float list
+    - float_list (optional): Input float list
+    - trigger_frames (optional): Frame indices to start a layer at, e.g. from Audio Onset Triggers; used in place of float_list and threshold
     - mask_colors: Colors for the dilation masks in the format "(r, g, b), (r, g, b), ..."
     - threshold: The threshold of the dilation
     - dilation_speed: Speed of dilation in pixels per frame
     - This node transforms the input float list and parameters into a dilation mask schedule string.
+    - schedule (output): The same schedule as a structured DILATION_SCHEDULE, which skips the string parsing downstream
     """
 
     def parse_colors(self, colors_str):
@@ -48,23 +55,15 @@ class AK_FloatListToDilateMaskSchedule:
             return [(255, 255, 0), (255, 0, 255)]  # Default to yellow and magenta
         return [(int(r), int(g), int(b)) for r, g, b in matches]
 
-    def float_list_to_dilate_mask_schedule(self, float_list, mask_colors, threshold, dilation_speed):
+    def float_list_to_dilate_mask_schedule(self, float_list=None, mask_colors="(255, 255, 0), (255, 0, 255)", threshold=0.5, dilation_speed=30, trigger_frames=None):
         colors = self.parse_colors(mask_colors)
-        schedule = []
-        current_color_index = 0
-        dilating = False
-
-        for index, value in enumerate(float_list):
-            if value > threshold and not dilating:
-                dilating = True
-                color = colors[current_color_index % len(colors)]
-                current_color_index += 1
-                schedule.append(f"({index}, {dilation_speed}, ({color[0]}, {color[1]}, {color[2]})),")
-            elif value <= threshold:
-                dilating = False
-
-        schedule_str = "".join(schedule)
-        return (schedule_str,)
+        if trigger_frames is not None:
+            schedule = DilationSchedule.from_frames(trigger_frames, dilation_speed, colors)
+        elif float_list is not None:
+            schedule = DilationSchedule.from_triggers(float_list, threshold, dilation_speed, colors)
+        else:
+            raise ValueError("Connect either a float_list or trigger_frames.")
+        return (schedule.to_string(), schedule)
 
 # Example usage
 # float_list = inputs["0_float"]
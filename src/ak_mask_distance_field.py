@@ -0,0 +1,43 @@
+from ..modules.dilation import SHAPES
+from ..modules.distance_field import FIELD_PRECISIONS, DistanceField
+
+class AK_MaskDistanceField:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "mask": ("MASK",),
+                "shape": (SHAPES,),
+                "precision": (FIELD_PRECISIONS,),
+                "workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "display": "number",
+                }),
+            },
+        }
+
+    CATEGORY = "💜Akatz Nodes/Mask"
+    RETURN_TYPES = ("DISTANCE_FIELD", "FLOAT", "FLOAT")
+    RETURN_NAMES = ("distance_field", "max_error_px", "dedup_ratio")
+    FUNCTION = "mask_distance_field"
+    DESCRIPTION = """
+    # Mask Distance Field
+    Computes the distance to the mask once per distinct mask frame, for any number of dilation nodes to share.
+    Connect distance_field to a dilation node in place of its mask; the node then uses the field's shape.
+    - mask: Input mask or mask batch (any value above 0 counts as mask)
+    - shape: "circle" for exact Euclidean distances, "square" for chessboard distances
+    - precision: "uint16" stores fixed-point distances (1/16 px steps at 1080p), "float16" half floats (finer near the mask, coarser far from it)
+    - workers: Number of threads used to process frames (0 uses every CPU core)
+    - max_error_px (output): Largest rounding error of a stored distance
+    - dedup_ratio (output): Mask frames per stored field, identical frames share one field
+    """
+
+    def mask_distance_field(self, mask, shape, precision, workers=0):
+        distance_field = DistanceField.compute(mask, shape, precision, workers)
+        return (distance_field, distance_field.max_error, distance_field.dedup_ratio())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The node pack is loaded by ComfyUI under its folder name; tests import its modules package directly.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
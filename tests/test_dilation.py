@@ -0,0 +1,187 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from modules.dilation import FieldCache, LayerRenderer, MaskDistanceFields, PackedMasks, activation_map, composite_layers, dilate_mask_frames, distance_transform, preview_error
+
+def enter_and_leave(num_frames=10, height=24, width=32):
+    """Empty mask at the first and last two frames, a moving square in between."""
+    masks = torch.zeros(num_frames, height, width)
+    for index in range(2, num_frames - 2):
+        masks[index, 8:12, 4 + index:8 + index] = 1
+    return masks
+
+def render(masks, layers, shape="circle"):
+    fields = MaskDistanceFields(PackedMasks.from_mask(masks), shape)
+    renderer = LayerRenderer(fields, layers, len(masks))
+    return renderer, composite_layers(renderer, (0, 0, 0), workers=1)
+
+def reference_render(masks, layers, shape="circle", background=(0, 0, 0)):
+    """Every layer thresholded on every frame's own distance field, later layers on top."""
+    frames = np.empty(masks.shape + (3,), dtype=np.float32)
+    for index, mask in enumerate(masks.numpy()):
+        field = distance_transform(mask > 0, shape)
+        frames[index] = np.array(background) / 255.0
+        for start_frame, speed, color in layers:
+            if index >= start_frame:
+                frames[index][field <= speed * (index - start_frame + 1)] = np.array(color) / 255.0
+    return torch.from_numpy(frames)
+
+LAYERS = [(0, 2, (255, 0, 0)), (3, 3, (0, 255, 0)), (5, 1, (0, 0, 255)), (20, 2, (255, 255, 0))]
+
+def test_equal_first_and_last_frames_are_not_static():
+    fields = MaskDistanceFields(PackedMasks.from_mask(enter_and_leave()))
+    assert fields.source_index(9) == 0
+    assert not fields.is_static()
+    assert fields.is_static(2)
+
+def test_cyclic_mask_is_not_static():
+    masks = enter_and_leave()
+    cycle = torch.cat([masks[2:4], masks[2:4], masks[2:3]])
+    assert not MaskDistanceFields(PackedMasks.from_mask(cycle)).is_static()
+
+def test_enter_and_leave_renders_middle_frames():
+    renderer, frames = render(enter_and_leave(), [(0, 2, (0, 255, 0))])
+    assert not renderer.static
+    lit = frames.flatten(1).amax(1) > 0
+    assert lit.tolist() == [False, False] + [True] * 6 + [False, False]
+
+def boundary_shift(result, reference):
+    """Largest distance from a pixel where two binary masks disagree to the reference's boundary."""
+    shifts = [0.0]
+    for frame, expected in zip(result.numpy() > 0, reference.numpy() > 0):
+        inside = cv2.distanceTransform(expected.astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        outside = cv2.distanceTransform((~expected).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        differs = frame != expected
+        if differs.any():
+            shifts.append(float(np.maximum(inside, outside)[differs].max()))
+    return max(shifts)
+
+@pytest.mark.parametrize("backend, factor", [("torch", 1), ("torch", 2), ("opencv", 4)])
+def test_preview_error_bounds_circle_dilations(backend, factor):
+    # Large enough that no dilation reaches the frame edge
+    masks = torch.zeros(3, 200, 200)
+    masks[:, 90:110, 98:102] = 1
+    radii = [5, 31, 60]
+    exact, _, _ = dilate_mask_frames(masks, range(3), radii, "circle", "opencv")
+    result, _, _ = dilate_mask_frames(masks, range(3), radii, "circle", backend, preview_factor=factor)
+    error = preview_error(factor, backend, "circle", max(radii))
+    assert boundary_shift(result, exact) <= error
+    if backend == "torch":
+        assert error > 0
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_static_mask_renders_from_activation_maps(shape):
+    masks = torch.zeros(24, 30, 40)
+    masks[:, 12:16, 6:9] = 1
+    renderer, frames = render(masks, LAYERS, shape)
+    assert renderer.static and renderer.use_activations
+    assert torch.equal(frames, reference_render(masks, LAYERS, shape))
+
+def test_static_mask_without_activation_maps_matches():
+    masks = torch.zeros(24, 30, 40)
+    masks[:, 12:16, 6:9] = 1
+    fields = MaskDistanceFields(PackedMasks.from_mask(masks))
+    fields.cache_limit = 0
+    renderer = LayerRenderer(fields, LAYERS, len(masks))
+    frames = composite_layers(renderer, (0, 0, 0), workers=1)
+    assert not renderer.use_activations
+    assert torch.equal(frames, reference_render(masks, LAYERS))
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_moving_mask_renders_every_frame(shape):
+    masks = enter_and_leave(24)
+    masks[5] = masks[3]
+    renderer, frames = render(masks, LAYERS, shape)
+    assert not renderer.static
+    assert torch.equal(frames, reference_render(masks, LAYERS, shape))
+
+def test_activation_map_is_the_first_frame_reaching_each_pixel():
+    field = np.array([[0.0, 1.0, 2.5, 7.0, np.inf]], dtype=np.float32)
+    assert activation_map(field, 2, 2, 6).tolist() == [[2, 2, 3, 5, 6]]
+    assert activation_map(field, 1, 0, 6).tolist() == [[1, 6, 6, 6, 6]]
+
+def test_layers_hidden_under_a_covering_layer_get_no_activation_map():
+    masks = torch.zeros(12, 20, 20)
+    masks[:, 9:11, 9:11] = 1
+    layers = [(0, 1, (255, 0, 0)), (0, 20, (0, 255, 0)), (4, 1, (0, 0, 255))]
+    renderer, frames = render(masks, layers)
+    assert renderer.visible_layers() == [1, 2]
+    assert 0 not in renderer._activations
+    assert torch.equal(frames, reference_render(masks, layers))
+
+def reference_coverage_frame(masks, layers, shape="circle"):
+    for index, mask in enumerate(masks.numpy()):
+        field = distance_transform(mask > 0, shape)
+        for start_frame, speed, _ in layers:
+            if index >= start_frame and (field <= speed * (index - start_frame + 1)).all():
+                return index
+    return -1
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_static_coverage_frame(shape):
+    masks = torch.zeros(30, 30, 40)
+    masks[:, 3:6, 30:33] = 1
+    renderer, _ = render(masks, LAYERS, shape)
+    assert renderer.coverage_frame() == reference_coverage_frame(masks, LAYERS, shape) != -1
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_moving_coverage_frame(shape):
+    masks = torch.zeros(30, 30, 40)
+    for index in range(30):
+        masks[index, 3:6, index:index + 3] = 1
+    renderer, _ = render(masks, LAYERS, shape)
+    assert renderer.coverage_frame() == reference_coverage_frame(masks, LAYERS, shape) != -1
+
+def test_coverage_frame_without_coverage():
+    renderer, _ = render(enter_and_leave(), [(0, 1, (255, 0, 0))])
+    assert renderer.coverage_frame() == reference_coverage_frame(enter_and_leave(), [(0, 1, (255, 0, 0))]) == -1
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_dilate_mask_frames_coverage_frame(shape):
+    masks = enter_and_leave(16)
+    indices = list(range(1, 16))
+    radii = [3 * index for index in indices]
+    result, coverage_frame, _ = dilate_mask_frames(masks, indices, radii, shape, "opencv", workers=1)
+    expected = min((index for index in indices if result[index].all()), default=-1)
+    assert coverage_frame == expected != -1
+
+def test_field_cache_evicts_least_recently_used():
+    cache = FieldCache(limit=3 * 400)
+    fields = {source: np.full((10, 10), source, dtype=np.float32) for source in range(4)}
+    for source in range(3):
+        cache.put(source, fields[source])
+    assert cache.get(0) is fields[0]
+    cache.put(3, fields[3])
+    assert cache.keys() == [2, 0, 3]
+    assert cache.get(1) is None
+    assert cache.nbytes == 3 * 400
+
+def test_field_cache_keeps_the_latest_field_over_its_limit():
+    cache = FieldCache(limit=0)
+    field = np.zeros((10, 10), dtype=np.float32), np.zeros((10, 10), dtype=np.int32)
+    cache.put(0, field)
+    assert 0 in cache and cache.nbytes == 800
+    cache.put(1, field)
+    assert cache.keys() == [1]
+
+def test_cache_limit_keeps_moving_renders_identical():
+    masks = enter_and_leave(24)
+    _, unlimited = render(masks, LAYERS)
+    fields = MaskDistanceFields(PackedMasks.from_mask(masks))
+    fields.cache_limit = 2 * masks[0].numel() * 4
+    limited = composite_layers(LayerRenderer(fields, LAYERS, len(masks)), (0, 0, 0), chunk_size=4, workers=2)
+    assert torch.equal(limited, unlimited)
+    assert fields._fields.nbytes <= fields.cache_limit
+
+@pytest.mark.parametrize("factor", [2, 4])
+def test_layer_renderer_preview_stays_within_preview_error(factor):
+    masks = torch.zeros(8, 120, 120)
+    for index in range(8):
+        masks[index, 50:58, 45 + 3 * index:52 + 3 * index] = 1
+    _, full = render(masks, [(0, 5, (255, 255, 255))])
+    fields = MaskDistanceFields(PackedMasks.from_mask(masks, factor))
+    renderer = LayerRenderer(fields, [(0, 5 / factor, (255, 255, 255))], len(masks))
+    preview = composite_layers(renderer, (0, 0, 0), workers=1, preview_factor=factor, frame_size=(120, 120))
+    assert preview.shape == full.shape
+    assert boundary_shift(preview[..., 0], full[..., 0]) <= preview_error(factor)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import torch
+from modules.dilation import dilate_mask_frames, distance_transform, field_cache_info
+from modules.distance_field import DistanceField, resolve_mask_fields
+
+def moving_masks(num_frames=6, height=40, width=50):
+    masks = torch.zeros(num_frames, height, width)
+    for index in range(num_frames):
+        masks[index, 10:14, 5 + 4 * (index % 3):9 + 4 * (index % 3)] = 1
+    masks[-1] = 0
+    return masks
+
+@pytest.mark.parametrize("precision", ["uint16", "float16"])
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_stored_fields_stay_within_max_error(precision, shape):
+    masks = moving_masks()
+    distance_field = DistanceField.compute(masks, shape, precision, workers=2, chunk_size=2)
+    for index, mask in enumerate(masks.numpy()):
+        exact = distance_transform(mask > 0, shape)
+        stored = distance_field.field(index)
+        finite = np.isfinite(exact)
+        assert np.array_equal(finite, np.isfinite(stored))
+        assert np.abs(stored[finite] - exact[finite]).max(initial=0) <= distance_field.max_error
+
+def test_identical_frames_share_a_field():
+    distance_field = DistanceField.compute(moving_masks())
+    # Frames 0 and 3, 1 and 4 repeat; the empty last frame is its own
+    assert distance_field.dedup_ratio() == 1.5
+    assert distance_field.nbytes == sum(chunk.nbytes for chunk in distance_field.chunks) + distance_field.masks.packed.nbytes
+    assert torch.equal(distance_field.to_mask(), moving_masks())
+
+def test_dilation_reads_the_stored_fields():
+    masks = moving_masks()
+    distance_field = DistanceField.compute(masks, "square")
+    radii = [3, 5, 8, 2, 6, 4]
+    expected, expected_coverage, _ = dilate_mask_frames(masks, range(6), radii, "square", "opencv", workers=1)
+    before = field_cache_info()
+    # The distance field's shape wins over the one passed in
+    result, coverage, _ = dilate_mask_frames(masks, range(6), radii, "circle", "opencv", workers=1, distance_field=distance_field)
+    assert field_cache_info().misses == before.misses
+    assert torch.equal(result, expected)
+    assert coverage == expected_coverage
+
+def test_resolve_mask_fields_prefers_the_distance_field():
+    masks = moving_masks()
+    distance_field = DistanceField.compute(masks, "square")
+    resolved_masks, fields = resolve_mask_fields(None, distance_field, "circle")
+    assert resolved_masks is distance_field.masks
+    assert fields.shape == "square" and fields.store is distance_field
+    _, preview = resolve_mask_fields(None, distance_field, "circle", 2)
+    assert preview.masks.shape == (6, 20, 25) and preview.store is None
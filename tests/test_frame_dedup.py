@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import torch
+from modules.dilation import MaskDistanceFields, PackedMasks, dilate_mask_frames, distance_transform, field_cache_info
+from modules.frame_dedup import dedup_ratio, first_occurrences, group_frames, packed_digest
+
+def repeating_masks():
+    """Three distinct frames in the order a, b, a, c, b, a, with a and c non-adjacent."""
+    distinct = torch.zeros(3, 20, 24)
+    distinct[0, 2:5, 3:6] = 1
+    distinct[1, 10:12, 15:20] = 1
+    distinct[2, 15:18, 2:4] = 1
+    return distinct[[0, 1, 0, 2, 1, 0]]
+
+def test_first_occurrences_and_groups():
+    sources = first_occurrences(["a", "b", "a", "c", "b", "a"])
+    assert sources == [0, 1, 0, 3, 1, 0]
+    assert group_frames(sources) == [[0, 2, 5], [1, 4], [3]]
+
+def test_packed_digest_matches_equal_frames_only():
+    masks = PackedMasks.from_mask(repeating_masks())
+    digests = [packed_digest(packed) for packed in masks.packed]
+    assert first_occurrences(digests) == [0, 1, 0, 3, 1, 0]
+
+def test_dedup_ratio():
+    assert dedup_ratio(6, 3) == 2.0
+    assert dedup_ratio(0, 0) == 1.0
+    fields = MaskDistanceFields(PackedMasks.from_mask(repeating_masks()))
+    assert fields.dedup_ratio(range(6)) == 2.0
+    assert fields.dedup_ratio(range(6), [1, 1, 1, 1, 1, 2]) == 1.5
+
+@pytest.mark.parametrize("shape", ["circle", "square"])
+def test_shared_frames_dilate_like_separate_ones(shape):
+    masks = repeating_masks()
+    radii = [6, 6, 6, 9, 6, 11]
+    before = field_cache_info()
+    result, _, ratio = dilate_mask_frames(masks, range(6), radii, shape, "opencv", workers=2)
+    computed = field_cache_info().misses - before.misses
+    for index, radius in enumerate(radii):
+        expected = distance_transform(masks[index].numpy() > 0, shape) <= radius
+        assert np.array_equal(result[index].numpy() > 0, expected)
+    assert ratio == 1.5
+    # One distance transform per distinct frame that is not dilated directly
+    assert computed <= 3
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import torch
+from modules import frame_output
+from modules.frame_output import allocate_frames, cache_limit, keeps_in_ram
+
+MB = 1024 * 1024
+SHAPE = (4, 256, 256, 4)  # 4 MB of float32
+
+def test_keeps_in_ram():
+    assert keeps_in_ram(SHAPE, "memory", 0)
+    assert not keeps_in_ram(SHAPE, "memmap", 1024)
+    assert keeps_in_ram(SHAPE, "auto", 4)
+    assert not keeps_in_ram(SHAPE, "auto", 3)
+    with pytest.raises(ValueError):
+        keeps_in_ram(SHAPE, "disk", 0)
+
+def test_allocate_frames_uses_a_memmap_above_the_limit(monkeypatch):
+    buffers = []
+    original = frame_output.memmap_frames
+    monkeypatch.setattr(frame_output, "memmap_frames", lambda *args: buffers.append(original(*args)) or buffers[-1])
+    frames = allocate_frames(SHAPE, "auto", ram_limit_mb=3)
+    assert len(buffers) == 1 and isinstance(buffers[0], np.memmap)
+    frames[0] = 1
+    assert buffers[0][0].min() == 1
+    frames = allocate_frames(SHAPE, "memory")
+    assert len(buffers) == 1 and frames.shape == SHAPE and frames.dtype == torch.float32
+
+def test_cache_limit_counts_what_stays_resident():
+    assert cache_limit(SHAPE, "memory", 16) is None
+    assert cache_limit(SHAPE, "memmap", 16) == 16 * MB
+    assert cache_limit(SHAPE, "memory", 16, sink=True) == 12 * MB
+    assert cache_limit(SHAPE, "memmap", 16, resident_bytes=10 * MB) == 6 * MB
+    assert cache_limit(SHAPE, "memmap", 16, resident_bytes=64 * MB) == 0
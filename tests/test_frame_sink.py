@@ -0,0 +1,67 @@
+import os
+import cv2
+import numpy as np
+import pytest
+import torch
+from modules.dilation import LayerRenderer, MaskDistanceFields, PackedMasks, composite_layers
+from modules.frame_sink import FrameSink, resolve_sink_path, to_uint8_frames
+
+def gradient_frames(num_frames=5, height=12, width=16):
+    frames = torch.linspace(0, 1, num_frames * height * width * 3).reshape(num_frames, height, width, 3)
+    return frames.numpy()
+
+def read_sequence(path, extension):
+    names = sorted(name for name in os.listdir(path) if name.endswith(extension))
+    if extension == ".npy":
+        return np.stack([np.load(os.path.join(path, name)) for name in names])
+    return np.stack([cv2.cvtColor(cv2.imread(os.path.join(path, name)), cv2.COLOR_BGR2RGB) for name in names])
+
+def test_resolve_sink_path(tmp_path):
+    video = str(tmp_path / "out" / "render.mp4")
+    assert resolve_sink_path(video, "mp4") == video
+    assert os.path.isdir(tmp_path / "out")
+    sequence = resolve_sink_path(str(tmp_path), "png", prefix="test")
+    assert os.path.isdir(sequence) and os.path.basename(sequence).startswith("test_")
+
+def test_to_uint8_frames_rounds_and_clips():
+    frames = np.array([-0.5, 0.0, 0.5, 1.0, 2.0], dtype=np.float32)
+    assert to_uint8_frames(frames).tolist() == [0, 0, 128, 255, 255]
+
+@pytest.mark.parametrize("sink_format, extension", [("npy", ".npy"), ("png", ".png")])
+def test_sequences_hold_every_frame_in_order(tmp_path, sink_format, extension):
+    frames = gradient_frames()
+    with FrameSink(str(tmp_path), sink_format) as sink:
+        sink.write(frames[:2])
+        sink.write(frames[2:])
+    assert sink.frame_count == len(frames)
+    assert np.array_equal(read_sequence(sink.path, extension), to_uint8_frames(frames))
+
+def test_video_sink_writes_every_frame(tmp_path):
+    path = str(tmp_path / "render.mp4")
+    with FrameSink(path, "mp4", fps=10) as sink:
+        sink.write(gradient_frames(7, 32, 32))
+    capture = cv2.VideoCapture(path)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    assert sink.frame_count == count == 7
+
+def test_unsupported_format():
+    with pytest.raises(ValueError):
+        FrameSink("", "none")
+
+def test_streamed_render_matches_in_memory_render(tmp_path):
+    masks = torch.zeros(21, 20, 24)
+    for index in range(21):
+        masks[index, 8:11, index % 18:index % 18 + 3] = 1
+    layers = [(0, 1, (255, 0, 0)), (6, 2, (0, 255, 0))]
+
+    def renderer():
+        return LayerRenderer(MaskDistanceFields(PackedMasks.from_mask(masks)), layers, len(masks))
+
+    frames = composite_layers(renderer(), (0, 0, 255), chunk_size=4, workers=2)
+    with FrameSink(str(tmp_path), "npy") as sink:
+        last = composite_layers(renderer(), (0, 0, 255), chunk_size=4, workers=2, sink=sink, frame_size=(20, 24))
+    assert sink.frame_count == 21
+    assert np.array_equal(read_sequence(sink.path, ".npy"), to_uint8_frames(frames.numpy()))
+    assert last.shape == (1, 20, 24, 3)
+    assert torch.allclose(last[0], frames[-1])
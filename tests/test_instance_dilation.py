@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import torch
+from modules.dilation import composite_layers, distance_transform
+from modules.instance_dilation import InstanceFields, InstanceRenderer, instance_labels
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+def enter_and_leave(num_frames=10, height=24, width=40):
+    """Two instances that are absent at the first and last two frames."""
+    masks = torch.zeros(num_frames, height, width)
+    for index in range(2, num_frames - 2):
+        masks[index, 4:8, 2 + index:6 + index] = 1
+        masks[index, 16:20, 24:28] = 1
+    return masks
+
+def three_instances(num_frames=8, moving=False):
+    """Three far-apart blobs with distinct mask values, the first one drifting when moving."""
+    masks = torch.zeros(num_frames, 40, 60)
+    for index in range(num_frames):
+        shift = index if moving else 0
+        masks[index, 4:7, 4 + shift:7 + shift] = 0.25
+        masks[index, 31:35, 6:9] = 0.5
+        masks[index, 18:21, 48:52] = 1.0
+    return masks
+
+def reference_render(masks, speeds, start_frame=0):
+    """Each instance thresholded on its own distance field; far-apart instances never compete for a pixel."""
+    frames = np.zeros(masks.shape + (3,), dtype=np.float32)
+    for index, mask in enumerate(masks.numpy()):
+        for value, speed, color in zip([0.25, 0.5, 1.0], speeds, COLORS):
+            if index >= start_frame:
+                field = distance_transform(mask == value, "circle")
+                frames[index][field <= speed * (index - start_frame + 1)] = np.array(color) / 255.0
+    return torch.from_numpy(frames)
+
+def render(masks, speeds, mode="mask_values", factor=1):
+    fields = InstanceFields(masks, mode, "circle", factor)
+    layers = [(0, speed / factor, color) for speed, color in zip(speeds, COLORS)]
+    renderer = InstanceRenderer(fields, layers[:fields.instance_count()], len(masks))
+    frames = composite_layers(renderer, (0, 0, 0), workers=1, preview_factor=factor, frame_size=masks.shape[1:3])
+    return renderer, frames
+
+def test_instance_labels():
+    frame = three_instances(1)[0].numpy()
+    assert set(np.unique(instance_labels(frame, "mask_values", np.array([0.25, 0.5, 1.0])))) == {0, 1, 2, 3}
+    labels = instance_labels(frame, "connected_components")
+    assert labels[5, 5] == 1 and labels[19, 50] == 2 and labels[32, 7] == 3
+
+def test_instance_count():
+    masks = three_instances()
+    assert InstanceFields(masks, "mask_values").instance_count() == 3
+    assert InstanceFields(masks, "connected_components").instance_count(workers=2) == 3
+
+@pytest.mark.parametrize("moving", [False, True])
+def test_instances_grow_with_their_own_speeds(moving):
+    masks = three_instances(moving=moving)
+    speeds = [1, 1.5, 0.5]
+    renderer, frames = render(masks, speeds)
+    assert renderer.static != moving
+    assert torch.equal(frames, reference_render(masks, speeds))
+
+def test_preview_keeps_instances_and_frame_size():
+    masks = three_instances()
+    _, full = render(masks, [1, 1.5, 0.5])
+    renderer, preview = render(masks, [1, 1.5, 0.5], factor=2)
+    assert len(renderer.layers) == 3
+    assert preview.shape == full.shape
+    # Colors stay with their instances; only boundaries move
+    assert (preview[-1].reshape(-1, 3).unique(dim=0) == full[-1].reshape(-1, 3).unique(dim=0)).all()
+
+def test_equal_first_and_last_frames_are_not_static():
+    fields = InstanceFields(enter_and_leave())
+    assert fields.source_index(9) == 0
+    assert not fields.is_static()
+    assert fields.is_static(2)
+
+def test_enter_and_leave_renders_middle_frames():
+    fields = InstanceFields(enter_and_leave())
+    layers = [(0, 2, (255, 0, 0)), (0, 2, (0, 255, 0))]
+    renderer = InstanceRenderer(fields, layers, len(fields))
+    assert not renderer.static
+    frames = composite_layers(renderer, (0, 0, 0), workers=1)
+    lit = frames.flatten(1).amax(1) > 0
+    assert lit.tolist() == [False, False] + [True] * 6 + [False, False]
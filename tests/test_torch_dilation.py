@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import torch
+from modules.dilation import dilate_mask_frames
+from modules.torch_dilation import dilate_batch, first_covered_frame, mask_sources, shape_error
+
+def random_masks(num_frames, height=33, width=47, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return (torch.rand(num_frames, height, width, generator=generator) > 0.98).to(torch.float32)
+
+def opencv_squares(masks, radii):
+    result, _, _ = dilate_mask_frames(masks, range(len(masks)), list(radii), "square", "opencv", workers=1)
+    return result
+
+@pytest.mark.parametrize("radius", [0, 1, 2, 5, 12, 40])
+def test_squares_match_opencv(radius):
+    masks = random_masks(4)
+    radii = [radius] * len(masks)
+    assert torch.equal(dilate_batch(masks, radii, "square"), opencv_squares(masks, radii))
+
+def test_per_frame_radius_tensor_matches_opencv():
+    masks = random_masks(8, seed=1)
+    masks[5] = masks[1]
+    radii = torch.tensor([0.0, 3.0, 1.5, 7.0, 2.0, 3.0, 11.9, 4.0])
+    assert torch.equal(dilate_batch(masks, radii, "square"), opencv_squares(masks, radii.tolist()))
+
+def test_static_mask_grows_incrementally_like_opencv():
+    masks = random_masks(1, seed=2).repeat(10, 1, 1)
+    radii = torch.arange(1, 11)
+    assert torch.equal(dilate_batch(masks, radii, "square"), opencv_squares(masks, radii.tolist()))
+
+def test_empty_batch():
+    masks = torch.zeros(0, 16, 16)
+    assert dilate_batch(masks, torch.zeros(0), "square").shape == (0, 16, 16)
+    assert dilate_batch(masks, [], "circle").shape == (0, 16, 16)
+
+def test_empty_frames_stay_empty():
+    masks = torch.zeros(3, 16, 16)
+    assert not dilate_batch(masks, [4, 8, 16], "square").any()
+
+@pytest.mark.parametrize("radius", [1, 4, 17, 60, 140])
+def test_circles_stay_within_shape_error(radius):
+    size = 2 * radius + 9
+    masks = torch.zeros(1, size, size)
+    masks[0, size // 2, size // 2] = 1
+    dilated = dilate_batch(masks, [radius], "circle")[0].numpy() > 0
+    rows, cols = np.mgrid[:size, :size]
+    distance = np.hypot(rows - size // 2, cols - size // 2)
+    error = shape_error("circle", radius)
+    assert distance[dilated].max() <= radius + error
+    assert (dilated | (distance > radius - error)).all()
+
+def test_incremental_circles_match_direct_dilation():
+    masks = random_masks(1, seed=4).repeat(6, 1, 1)
+    radii = [0, 3, 4, 9, 20, 21]
+    direct = torch.stack([dilate_batch(masks[:1], [radius], "circle")[0] for radius in radii])
+    assert torch.equal(dilate_batch(masks, radii, "circle"), direct)
+
+def test_radius_count_must_match_batch():
+    with pytest.raises(ValueError):
+        dilate_batch(random_masks(3), [1, 2], "square")
+
+def test_mask_sources_match_identical_frames():
+    masks = random_masks(5, seed=3)
+    masks[2] = masks[0]
+    masks[4] = masks[1]
+    assert mask_sources(masks) == [0, 1, 0, 3, 1]
+
+def test_torch_backend_reports_coverage_and_dedup():
+    masks = torch.zeros(4, 9, 9)
+    masks[:, 4, 4] = 1
+    result, coverage_frame, ratio = dilate_mask_frames(masks, range(4), [1, 2, 4, 4], "square", "torch")
+    assert torch.equal(result, opencv_squares(masks, [1, 2, 4, 4]))
+    assert coverage_frame == 2
+    assert ratio == pytest.approx(4 / 3)
+
+@pytest.mark.parametrize("shape", ["square", "circle"])
+@pytest.mark.parametrize("seed", range(4))
+def test_first_covered_frame_matches_full_scan(shape, seed):
+    generator = torch.Generator().manual_seed(seed)
+    masks = torch.zeros(3, 24, 30)
+    masks[0, 2, 3] = 1
+    masks[1, 20, 25] = 1
+    masks[2, 10:14, 12:16] = 1
+    frames = masks[torch.randint(0, 3, (12,), generator=generator)]
+    radii = torch.randint(0, 36, (12,), generator=generator).tolist()
+    indices = torch.randperm(40, generator=generator)[:12].tolist()
+    dilated = dilate_batch(frames, radii, shape)
+    expected = min((index for index, frame in zip(indices, dilated) if frame.all()), default=-1)
+    assert first_covered_frame(dilated, indices, radii, mask_sources(frames), shape) == expected
+
+def test_first_covered_frame_without_coverage():
+    masks = random_masks(5, seed=5)
+    dilated = dilate_batch(masks, [0] * 5, "circle")
+    assert first_covered_frame(dilated, list(range(5)), [0] * 5, mask_sources(masks)) == -1